@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the FISG HTML Modifier System
+
+Generates synthetic landing pages modelled on example/*/index.html (head
+links, CSS with url() and dialog rules, image sections on www.fisg.com,
+the join form with the country select, the dialog and its script) and
+times HTMLModifier on them:
+
+- pages:     one page per size (10KB .. 50MB), timed end to end and per
+             step (StepProfiler)
+- campaigns: 1 .. 10k campaigns with one page each, written to a temporary
+             working tree and run through run_language_tasks end to end
+
+- adversarial: pages built to defeat backtracking locators (many forms
+             and no submit button, unclosed tags, dialogs with no </html>,
+             ...), checked for flat time per byte as the page grows
+
+Results are written as JSON with --save and compared against a stored
+run with --baseline.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import statistics
+from typing import Optional
+
+from modify_html import (HTMLModifier, LanguageTask, StepProfiler, modifier_version, run_language_tasks)
+
+
+DEFAULT_SIZES = ('10KB', '100KB', '1MB', '10MB', '50MB')
+DEFAULT_CAMPAIGNS = (1, 10, 100, 1000, 10000)
+QUICK_SIZES = ('10KB', '100KB', '1MB')
+QUICK_CAMPAIGNS = (1, 10, 100)
+CAMPAIGN_PAGE_SIZE = '10KB'
+
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 * 1024, 'B': 1}
+
+
+def parse_size(text: str) -> int:
+    """'10KB' / '50MB' / '2048' -> bytes"""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+# --- synthetic pages --------------------------------------------------------
+
+PAGE_HEAD = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Double Your Trading Benefit with FISG</title>
+    <link rel="icon" href="https://www.fisg.com/wp-content/uploads/2025/01/cropped-logo-icon-32x32.png" sizes="32x32" />
+    <link rel="apple-touch-icon" href="https://www.fisg.com/wp-content/uploads/2025/01/cropped-logo-icon-180x180.png" />
+    <meta name="msapplication-TileImage" content="https://www.fisg.com//wp-content/uploads/2025/01/cropped-logo-icon-270x270.png" />
+    <link rel="stylesheet" type="text/css" href="https://www.fisg.com/cssjs/competition/font.css" />
+    <style>
+        html, body {
+            font-family: 'Noto Sans', system-ui, -apple-system, BlinkMacSystemFont, sans-serif;
+        }
+    </style>
+    <style>
+        html, body {
+        margin: 0;
+        scroll-behavior: smooth;
+        }
+'''
+
+CSS_BLOCK = '''        .fl-section-{n} .fl-perk-item-box {{
+        --bg-img: url(https://www.fisg.com/wp-content/uploads/2025/11/fisg-header-bg-{n}.jpg);
+        padding: 1.25rem;
+        border-radius: 0.75rem;
+        background-color: rgba(255, 255, 255, 0.75);
+        }}
+'''
+
+DIALOG_CSS = '''        dialog {
+        justify-content: center;
+        width: 100svw;
+        height: 100vh;
+        background-color: rgba(0, 0, 0, 0.5);
+        border: none;
+        position: fixed;
+        }
+        dialog[open] {
+        display: flex;
+        }
+        dialog .dialog-card {
+        margin-block: 2rem;
+        padding: 1.25rem;
+        position: relative;
+        }
+        dialog .dialog-close {
+        padding: 0.25em;
+        position: absolute;
+        top: 0.75rem;
+        }
+    </style>
+</head>
+<body>
+'''
+
+BODY_BLOCK = '''    <section class="fl-section-{n}">
+        <div class="fl-container">
+            <div class="fl-flex-column" style="gap: 2rem;">
+                <hgroup class="fl-hgroup">
+                    <h3 class="fl-hgroup-text text-color-green">Enjoy the Privilege &amp; Benefit #{n}</h3>
+                    <h6>More perks. More rewards. More ways to profit.</h6>
+                </hgroup>
+                <ul class="fl-perk-list">
+                    <li class="fl-perk-item">
+                        <div class="fl-perk-item-box">
+                            <img draggable="false" src="https://www.fisg.com/wp-content/uploads/2025/11/fl-perk-item-img-{n}a.jpg" alt="">
+                            <span class="fl-perk-item-text">Profit Boost</span>
+                        </div>
+                    </li>
+                    <li class="fl-perk-item">
+                        <div class="fl-perk-item-box" style="background: url('https://www.fisg.com/wp-content/uploads/2025/11/fl-perk-bg-{n}.png')">
+                            <img draggable="false" src="https://www.fisg.com/wp-content/uploads/2025/11/fl-perk-item-img-{n}b.jpg" alt="" style="width: auto; height: 14px;">
+                            <span class="fl-perk-item-text">Cashback</span>
+                        </div>
+                    </li>
+                </ul>
+                <a class="fl-nav-dropdown-link" href="https://www.fisg.com/th/landing/fastbull-{n}">Read more</a>
+                <a class="fl-footer-doc-link" target="_blank" href="https://partner.example.com/docs/{n}">Partner</a>
+            </div>
+        </div>
+    </section>
+'''
+
+PAGE_TAIL = '''    <section id="joinNow" style="padding-block: 5rem;">
+        <div class="fl-container">
+            <div class="fl-form-row">
+                <div class="fl-form-col">
+                    <form action="">
+                        <div class="fl-form-column">
+                            <div class="fl-form-group">
+                                <label for="name">Name (Required)</label>
+                                <input type="text" id="name" required>
+                            </div>
+                            <div class="fl-form-group">
+                                <label for="email">Email (Required)</label>
+                                <input type="email" id="email" required>
+                            </div>
+                            <div class="fl-form-group">
+                                <label for="country">Country (Required)</label>
+                                <select name="country" id="country" required>
+                                    <option value="">Please Select Your Country</option>
+                                </select>
+                            </div>
+                            <div class="fl-form-group">
+                                <button type="submit">Start Your Trading Journey</button>
+                            </div>
+                        </div>
+                    </form>
+                </div>
+            </div>
+        </div>
+    </section>
+    <footer class="fl-footer">
+        <a class="fl-footer-doc-link" target="_blank" href="https://www.fisg.com/files/risk_statement.pdf">Risk Disclosure</a>
+    </footer>
+    <dialog class="dialog" data-dialog-id="1">
+        <div class="dialog-card">
+            <div>
+                Lorem ipsum dolor sit amet consectetur adipisicing elit.
+            </div>
+            <button class="dialog-close" type="button" data-dialog-id="1">close</button>
+        </div>
+    </dialog>
+    <script>
+        document.querySelectorAll(".dialog-close").forEach(button => {
+            button.addEventListener("click", () => {
+                const dialog = document.querySelector(`.dialog[data-dialog-id="${button.dataset.dialogId}"]`);
+                dialog?.close();
+            });
+        });
+    </script>
+</body>
+</html>
+'''
+
+
+def generate_page(size: int) -> str:
+    """A landing page of roughly `size` characters.
+
+    The fixed skeleton (head, dialog CSS, join form, dialog, script) matches
+    what the eleven steps look for; the rest is numbered CSS rules and
+    content sections, split about 1:4 between <style> and <body>, each
+    carrying distinct www.fisg.com URLs.
+    """
+    fixed = len(PAGE_HEAD) + len(DIALOG_CSS) + len(PAGE_TAIL)
+    css_size = len(CSS_BLOCK.format(n=0))
+    body_size = len(BODY_BLOCK.format(n=0))
+    budget = max(size - fixed, 0)
+    css_blocks = budget // 5 // css_size
+    body_blocks = max((budget - css_blocks * css_size) // body_size, 1)
+    parts = [PAGE_HEAD]
+    parts.extend(CSS_BLOCK.format(n=n) for n in range(css_blocks))
+    parts.append(DIALOG_CSS)
+    parts.extend(BODY_BLOCK.format(n=n) for n in range(body_blocks))
+    parts.append(PAGE_TAIL)
+    return ''.join(parts)
+
+
+# One repeated unit per adversarial shape, each aimed at a locator that
+# used to rescan the rest of the page per attempt
+ADVERSARIAL_UNITS = {
+    'forms_without_submit': '<form action="/join"><input type="text" name="a"></form>\n',
+    'unclosed_tags': '<form <select name="country" id="country" <button type="button" <dialog class="dialog" ',
+    'cards_without_close': '<div class="dialog-card"><p>text</p></div>\n',
+    'dialog_rules_without_style_end': 'dialog { color: red; }\n',
+    'dialogs_without_html_end': '<dialog class="dialog"><p>text</p></dialog>\n',
+    'link_values_unclosed': '<input value="a" value="b" name="link" ',
+    'host_urls_unclosed': '<img src="https://www.fisg.com/a.png" ',
+}
+ADVERSARIAL_SIZES = ('64KB', '512KB')
+
+
+def generate_adversarial_page(kind: str, size: int) -> str:
+    """A page of roughly `size` characters made of the ADVERSARIAL_UNITS[kind] unit"""
+    unit = ADVERSARIAL_UNITS[kind]
+    return '<html><head></head><body>\n' + unit * max(size // len(unit), 1)
+
+
+def write_corpus(directory: str, sizes=ADVERSARIAL_SIZES) -> list:
+    """Write every adversarial page to directory/<kind>-<size>.html"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in ADVERSARIAL_UNITS:
+        for size_label in sizes:
+            path = os.path.join(directory, f'{kind}-{size_label}.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(generate_adversarial_page(kind, parse_size(size_label)))
+            paths.append(path)
+    return paths
+
+
+# --- cases ------------------------------------------------------------------
+
+def time_page(page: str, repeat: int) -> dict:
+    """Time one page end to end (best and median of `repeat`) and per step (one profiled run)"""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            modifier = HTMLModifier(page, working_dir='benchmark', config_name='benchmark')
+            started = time.perf_counter()
+            modifier.apply_all_modifications()
+            timings.append(time.perf_counter() - started)
+        profiler = StepProfiler()
+        HTMLModifier(page, working_dir='benchmark', config_name='benchmark').apply_all_modifications(
+            profiler=profiler)
+        # Tracing slows everything after it down; the profiler turned it on
+        tracemalloc.stop()
+    return {
+        'bytes': len(page.encode('utf-8')),
+        'best_s': min(timings),
+        'median_s': statistics.median(timings),
+        'steps_ms': {record['step']: record['wall_ms'] for record in profiler.records},
+        'peak_kb': max((record['peak_bytes'] or 0) for record in profiler.records) / 1024,
+    }
+
+
+def time_campaigns(count: int, page: str, jobs: int) -> dict:
+    """Write `count` one-page campaigns to a temporary tree and process them all"""
+    with tempfile.TemporaryDirectory(prefix='modify_html_bench_') as root:
+        tasks = []
+        for n in range(count):
+            example_dir = os.path.join(root, f'campaign{n}')
+            os.makedirs(os.path.join(example_dir, 'en'))
+            with open(os.path.join(example_dir, 'en', 'index.html'), 'w', encoding='utf-8') as f:
+                f.write(page)
+            tasks.append(LanguageTask('en', example_dir, f'campaign{n}', f'campaign{n}'))
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcomes = run_language_tasks(tasks, jobs)
+        seconds = time.perf_counter() - started
+    return {
+        'pages': count,
+        'failed': outcomes.count(False),
+        'total_s': seconds,
+        'per_page_ms': seconds * 1000 / count,
+    }
+
+
+def run_benchmarks(sizes, campaigns, repeat: int = 3, jobs: int = 1) -> dict:
+    results = {}
+    for size_label in sizes:
+        page = generate_page(parse_size(size_label))
+        case = f'page/{size_label}'
+        print(f"  {case} ...", end='', flush=True)
+        results[case] = time_page(page, repeat)
+        print(f" {results[case]['best_s'] * 1000:.1f} ms")
+    campaign_page = generate_page(parse_size(CAMPAIGN_PAGE_SIZE))
+    for count in campaigns:
+        case = f'campaigns/{count}'
+        print(f"  {case} ...", end='', flush=True)
+        results[case] = time_campaigns(count, campaign_page, jobs)
+        print(f" {results[case]['total_s']:.2f} s")
+    return results
+
+
+def time_adversarial(kind: str, repeat: int, sizes=ADVERSARIAL_SIZES) -> dict:
+    """Best time per KB at the smallest and largest size; `growth` is their ratio"""
+    per_kb = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for size_label in (sizes[0], sizes[-1]):
+            page = generate_adversarial_page(kind, parse_size(size_label))
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                HTMLModifier(page, working_dir='benchmark', config_name='benchmark').apply_all_modifications()
+                timings.append(time.perf_counter() - started)
+            per_kb.append(min(timings) * 1000 / (len(page) / 1024))
+    return {
+        'best_s': per_kb[1] * parse_size(sizes[-1]) / 1024 / 1000,
+        'small_ms_per_kb': per_kb[0],
+        'large_ms_per_kb': per_kb[1],
+        'growth': per_kb[1] / per_kb[0] if per_kb[0] else 0.0,
+    }
+
+
+def run_adversarial(repeat: int = 3, max_growth: float = 2.0) -> tuple:
+    """Time every adversarial shape; return (results, cases whose time per byte grew past max_growth)"""
+    results = {}
+    failures = []
+    for kind in ADVERSARIAL_UNITS:
+        case = f'adversarial/{kind}'
+        print(f"  {case} ...", end='', flush=True)
+        result = results[case] = time_adversarial(kind, repeat)
+        flat = result['growth'] <= max_growth
+        if not flat:
+            failures.append(case)
+        print(f" {result['small_ms_per_kb']:.3f} -> {result['large_ms_per_kb']:.3f} ms/KB"
+              f" (x{result['growth']:.2f}) {'✓' if flat else '✗ not flat'}")
+    return results, failures
+
+
+# --- reporting --------------------------------------------------------------
+
+def headline(result: dict) -> float:
+    """The number a case is compared on: best end-to-end page time or total campaign time"""
+    return result['best_s'] if 'best_s' in result else result['total_s']
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print each case against the baseline; return the cases slower by more than threshold"""
+    regressions = []
+    print("\n" + "="*60)
+    print("BENCHMARK vs BASELINE")
+    print("="*60)
+    for case, result in results.items():
+        before = baseline.get(case)
+        now = headline(result)
+        if before is None:
+            print(f"{case:<32} {now:>10.4f} s   (new)")
+            continue
+        then = headline(before)
+        change = (now - then) / then if then else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  ✗ regression'
+            regressions.append(case)
+        elif change < -threshold:
+            flag = '  ✓ faster'
+        print(f"{case:<32} {now:>10.4f} s  {then:>10.4f} s  {change:>+7.1%}{flag}")
+    return regressions
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the FISG HTML Modifier System')
+    parser.add_argument('--sizes', nargs='+', default=None, metavar='SIZE',
+                        help=f"page sizes to generate (default: {' '.join(DEFAULT_SIZES)})")
+    parser.add_argument('--campaigns', nargs='+', type=int, default=None, metavar='N',
+                        help=f"campaign counts to run (default: {' '.join(map(str, DEFAULT_CAMPAIGNS))})")
+    parser.add_argument('--repeat', type=int, default=3, help="end-to-end runs per page size (best is kept)")
+    parser.add_argument('--jobs', type=int, default=1, metavar='N', help="worker processes for the campaign cases")
+    parser.add_argument('--quick', action='store_true',
+                        help=f"only {' '.join(QUICK_SIZES)} and {' '.join(map(str, QUICK_CAMPAIGNS))} campaigns")
+    parser.add_argument('--save', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="compare against results saved with --save")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown counted as a regression (default: 0.10)")
+    parser.add_argument('--adversarial', action='store_true',
+                        help=f"run the adversarial corpus ({' -> '.join(ADVERSARIAL_SIZES)}) instead and "
+                             "fail if time per byte is not flat")
+    parser.add_argument('--max-growth', type=float, default=2.0,
+                        help="allowed growth of time per byte across the adversarial sizes (default: 2.0)")
+    parser.add_argument('--write-corpus', metavar='DIR', help="write the adversarial pages to DIR and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_args(argv)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    campaigns = args.campaigns or (QUICK_CAMPAIGNS if args.quick else DEFAULT_CAMPAIGNS)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    if args.write_corpus:
+        paths = write_corpus(args.write_corpus)
+        print(f"✓ Wrote {len(paths)} adversarial pages to {args.write_corpus}")
+        return 0
+
+    print("="*60)
+    print("FISG HTML MODIFIER BENCHMARK")
+    print("="*60)
+    failures = []
+    if args.adversarial:
+        results, failures = run_adversarial(args.repeat, args.max_growth)
+    else:
+        results = run_benchmarks(sizes, campaigns, args.repeat, jobs)
+
+    report = {
+        'meta': {
+            'modifier_version': modifier_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'jobs': jobs,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"\n✓ Results written: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get('results', {}), args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}")
+            return 1
+        print("\n✓ No regressions")
+    if failures:
+        print(f"\n✗ {len(failures)} adversarial case(s) grew faster than linear: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
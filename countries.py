@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Country options of the join form, rendered at build time from countries.json.
+
+The data file lists the countries of the country <select> in display order:
+
+    {"value": "TH", "code": "66", "lang": "th", "name": {"en": "Thailand", "th": "ไทย"}}
+
+value is what the form sends as country, code and lang are the attributes
+countryChange() copies into the phonecode and language hidden inputs (lang
+is left out when it is "en", the fallback countryChange() already uses),
+and name holds the display name per page language, with "en" required as
+the fallback. `CountryData.options(language)` renders the <option> list of
+one page language, so the edge worker no longer has to expand
+{{select:country}} on every request. Only languages every country has a
+name in are rendered (`CountryData.has_names`); a page in any other
+language keeps the placeholder, so it never shows a half-English list.
+
+`load_countries(path)` parses a data file once per process and again only
+when its size or mtime changes. `python3 countries.py [FILE]` checks one.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from html import escape
+from typing import Optional
+
+COUNTRY_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'countries.json')
+# The language countryChange() falls back to, and the name every country must have
+FALLBACK_LANGUAGE = 'en'
+
+
+class CountryData:
+    """The countries of a data file, in display order, and a digest of them"""
+
+    def __init__(self, countries: list):
+        self.countries = countries
+        canonical = json.dumps(countries, ensure_ascii=False, sort_keys=True)
+        self.digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+
+    @classmethod
+    def parse(cls, text: str) -> 'CountryData':
+        """The data of a countries.json text; ValueError if an entry is incomplete"""
+        data = json.loads(text)
+        countries = data.get('countries') if isinstance(data, dict) else None
+        if not isinstance(countries, list) or not countries:
+            raise ValueError('no "countries" list')
+        seen = set()
+        for i, country in enumerate(countries):
+            if not isinstance(country, dict):
+                raise ValueError(f"country {i + 1} is not an object")
+            for key in ('value', 'code'):
+                if not isinstance(country.get(key), str) or not country[key]:
+                    raise ValueError(f"country {i + 1} has no {key}")
+            names = country.get('name')
+            if not isinstance(names, dict) or not isinstance(names.get(FALLBACK_LANGUAGE), str):
+                raise ValueError(f"{country['value']} has no {FALLBACK_LANGUAGE} name")
+            if country['value'] in seen:
+                raise ValueError(f"{country['value']} is listed twice")
+            seen.add(country['value'])
+        return cls(countries)
+
+    @property
+    def languages(self) -> list:
+        """Every language some country has a name in"""
+        return sorted({language for country in self.countries for language in country['name']})
+
+    def named(self, language: str) -> int:
+        """How many countries have a name in language"""
+        return sum(1 for country in self.countries if language in country['name'])
+
+    def has_names(self, language: str) -> bool:
+        """Whether every country has a name in language, so its list needs no fallback names"""
+        return self.named(language) == len(self.countries)
+
+    def options(self, language: str, indent: str = '') -> str:
+        """The <option> list of a page language, one per line after the first at indent"""
+        lines = []
+        for country in self.countries:
+            name = country['name'].get(language) or country['name'][FALLBACK_LANGUAGE]
+            attributes = f'value="{escape(country["value"])}" code="{escape(country["code"])}"'
+            if country.get('lang', FALLBACK_LANGUAGE) != FALLBACK_LANGUAGE:
+                attributes += f' lang="{escape(country["lang"])}"'
+            lines.append(f'<option {attributes}>{escape(name, quote=False)}</option>')
+        return ('\n' + indent).join(lines)
+
+
+_loaded = {}    # path -> ((size, mtime_ns), CountryData)
+
+
+def load_countries(path: str = COUNTRY_DATA) -> CountryData:
+    """The country data of a file, parsed once per process and again when the file changes.
+
+    Raises OSError if the file cannot be read and ValueError if it is not
+    valid country data.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = CountryData.parse(f.read())
+    _loaded[path] = (key, data)
+    return data
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description='Check the country data of --prerender-countries')
+    parser.add_argument('path', nargs='?', default=COUNTRY_DATA, metavar='FILE',
+                        help=f"the data file (default: {COUNTRY_DATA})")
+    args = parser.parse_args(argv)
+    try:
+        data = load_countries(args.path)
+    except (OSError, ValueError) as e:
+        print(f"✗ {args.path}: {e}")
+        return 1
+    total = len(data.countries)
+    complete = [language for language in data.languages if data.has_names(language)]
+    partial = [f"{language} ({data.named(language)}/{total})" for language in data.languages
+               if language not in complete]
+    print(f"✓ {args.path}: {total} countries, rendered in {', '.join(complete)}")
+    if partial:
+        print(f"⚠ Names incomplete, left to the edge worker: {', '.join(partial)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Critical-CSS subsetting of the stylesheets injected from cdnjs.
+
+The stylesheets are read from the copies committed in vendor/, next to
+their licenses (fetched with `python3 critical_css.py --fetch` and checked
+against the integrity hash of their <link>), so a build never touches the
+network. `Stylesheet.subset`
+keeps the rules whose selectors can match a page, as seen by `PageUsage`:
+
+- a selector is dropped only if it needs a class, id or element the page
+  does not have; pseudo-classes, pseudo-elements and attribute selectors
+  are assumed to match, except the ones on `class` ([class^="bi-"], ...),
+  which are checked against the page's class attributes;
+- class names, ids and elements come from the page's tags, plus every word
+  of every string literal in its inline scripts, so a class a script adds
+  (classList.add('show')) is kept;
+- selector lists are cut down to the selectors that match; @media,
+  @supports, @layer and @container blocks keep whatever of their rules is
+  kept; rules that need no class, id or element (:root, *) are always kept;
+- @font-face is kept when the kept rules name its font-family, @keyframes
+  when they name the animation; any other at-rule is kept as is;
+- /*! ... */ license comments are kept, other comments dropped;
+- relative url(...) references are made absolute against the stylesheet's
+  URL, so an inlined subset still finds its fonts.
+
+The subset is cut from the original text in the original order, so its
+rules cascade exactly like they did in the full stylesheet.
+"""
+
+import os
+import re
+import sys
+import base64
+import hashlib
+import argparse
+import functools
+import tempfile
+import urllib.request
+from typing import Optional
+from urllib.parse import urljoin
+
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor')
+
+# CSS
+_TOKEN = re.compile(r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|/\*.*?\*/|[{};]', re.S)
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_GUARDED_COMMENT = re.compile(r'/\*!.*?\*/', re.S)
+_AT_NAME = re.compile(r'@([-\w]+)')
+GROUPING_RULES = ('media', 'supports', 'layer', 'container', 'document', '-moz-document')
+_FONT_FAMILY = re.compile(r'font-family\s*:\s*(["\']?)([^;"\'}]+)\1', re.I)
+_KEYFRAMES_NAME = re.compile(r'@[-\w]*keyframes\s+(["\']?)([-\w]+)\1', re.I)
+_URL = re.compile(r'url\(\s*(["\']?)([^"\')]+)\1\s*\)')
+_ABSOLUTE_URL = re.compile(r'(?:[a-zA-Z][\w+.-]*:)?//')
+_WORD = re.compile(r'[-\w]+')
+
+# Selectors
+_ATTRIBUTE = re.compile(r'\[\s*([-\w]+)\s*(?:([~|^$*]?=)\s*("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|[^\]\s]+)'
+                        r'\s*(?:[iIsS]\s*)?)?\]')
+_PSEUDO = re.compile(r'::?[-\w]+(?:\((?:[^()]|\([^()]*\))*\))?')
+_CLASS = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+_ID = re.compile(r'#(-?[_a-zA-Z][\w-]*)')
+_TYPE = re.compile(r'(?:^|(?<=[\s>+~(]))([a-zA-Z][\w-]*)')
+
+# HTML
+_TAG_NAME = re.compile(r'<([a-zA-Z][\w-]*)')
+_CLASS_ATTRIBUTE = re.compile(r'\sclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+_ID_ATTRIBUTE = re.compile(r'\sid\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+_INLINE_SCRIPT = re.compile(r'<script(?![^<>]*\ssrc\s*=)[^<>]*>(.*?)</script\s*>', re.I | re.S)
+_JS_STRING = re.compile(r'"((?:[^"\\\n]|\\.)*)"|\'((?:[^\'\\\n]|\\.)*)\'|`((?:[^`\\]|\\.)*)`', re.S)
+_NAME = re.compile(r'-?[_a-zA-Z][\w-]*')
+
+
+class PageUsage:
+    """The class names, ids and elements a page uses, for selector matching"""
+
+    __slots__ = ('classes', 'ids', 'tags', 'class_values')
+
+    def __init__(self, html: str):
+        self.tags = {name.lower() for name in _TAG_NAME.findall(html)}
+        self.class_values = [a or b for a, b in _CLASS_ATTRIBUTE.findall(html)]
+        self.classes = {name for value in self.class_values for name in value.split()}
+        self.ids = {a or b for a, b in _ID_ATTRIBUTE.findall(html)}
+        for script in _INLINE_SCRIPT.findall(html):
+            for literal in _JS_STRING.finditer(script):
+                text = literal.group(literal.lastindex)
+                words = _NAME.findall(text)
+                self.classes.update(words)
+                self.ids.update(words)
+                self.tags.update(word.lower() for word in words)
+                self.class_values.append(text)
+
+    def has_class_value(self, operator: str, value: str) -> bool:
+        """Whether a class attribute of the page matches [class<operator>"value"]"""
+        if operator == '~=':
+            return value in self.classes
+        test = {
+            '=': lambda text: text == value,
+            '^=': lambda text: text.startswith(value),
+            '$=': lambda text: text.endswith(value),
+            '*=': lambda text: value in text,
+            '|=': lambda text: text == value or text.startswith(value + '-'),
+        }[operator]
+        return any(test(text) for text in self.class_values)
+
+
+@functools.lru_cache(maxsize=None)
+def selector_requirements(selector: str) -> tuple:
+    """(classes, ids, elements, class attribute tests) a selector needs the page to have"""
+    tests = []
+
+    def attribute(match):
+        if match.group(1).lower() == 'class' and match.group(2):
+            value = match.group(3)
+            if value[0] in '"\'':
+                value = value[1:-1]
+            tests.append((match.group(2), value))
+        return ' '
+    stripped = _PSEUDO.sub(' ', _ATTRIBUTE.sub(attribute, selector))
+    return (frozenset(_CLASS.findall(stripped)), frozenset(_ID.findall(stripped)),
+            frozenset(name.lower() for name in _TYPE.findall(stripped)), tuple(tests))
+
+
+def selector_matches(selector: str, usage: PageUsage) -> bool:
+    classes, ids, tags, tests = selector_requirements(selector)
+    return (classes <= usage.classes and ids <= usage.ids and tags <= usage.tags
+            and all(usage.has_class_value(operator, value) for operator, value in tests))
+
+
+def split_selectors(prelude: str) -> list:
+    """A selector list split on its top-level commas"""
+    selectors = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, char in enumerate(prelude):
+        if quote:
+            if char == quote and prelude[i - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:i].strip())
+            start = i + 1
+    selectors.append(prelude[start:].strip())
+    return [selector for selector in selectors if selector]
+
+
+class Rule:
+    __slots__ = ('selectors', 'block')
+
+    def __init__(self, selectors: list, block: str):
+        self.selectors = selectors
+        self.block = block
+
+
+class GroupingRule:
+    __slots__ = ('prelude', 'children')
+
+    def __init__(self, prelude: str, children: list):
+        self.prelude = prelude
+        self.children = children
+
+
+class NamedRule:
+    """@font-face (name = its font-family) or @keyframes (name = the animation)"""
+
+    __slots__ = ('kind', 'name', 'text')
+
+    def __init__(self, kind: str, name: str, text: str):
+        self.kind = kind
+        self.name = name
+        self.text = text
+
+
+def _next_token(css: str, pos: int, end: int):
+    """The next { } or ; at or after pos, skipping strings and comments"""
+    while True:
+        match = _TOKEN.search(css, pos, end)
+        if match is None or match.group() in '{};':
+            return match
+        pos = match.end()
+
+
+def _block_end(css: str, pos: int, end: int) -> int:
+    """Offset of the } closing the block whose content starts at pos (end if unclosed)"""
+    depth = 1
+    while True:
+        match = _next_token(css, pos, end)
+        if match is None:
+            return end
+        if match.group() == '{':
+            depth += 1
+        elif match.group() == '}':
+            depth -= 1
+            if depth == 0:
+                return match.start()
+        pos = match.end()
+
+
+def parse_rules(css: str, pos: int = 0, end: Optional[int] = None) -> list:
+    """The rules of css[pos:end]: Rule, GroupingRule, NamedRule, or the text of any other at-rule"""
+    end = len(css) if end is None else end
+    nodes = []
+    while pos < end:
+        match = _next_token(css, pos, end)
+        if match is None:
+            break
+        # License banners (/*! ... */) are kept wherever they are
+        nodes.extend(_GUARDED_COMMENT.findall(css, pos, match.start()))
+        prelude = _COMMENT.sub('', css[pos:match.start()]).strip()
+        if match.group() != '{':
+            if match.group() == ';' and prelude:
+                nodes.append(prelude + ';')
+            pos = match.end()
+            continue
+        close = _block_end(css, match.end(), end)
+        pos = close + 1
+        if not prelude.startswith('@'):
+            nodes.append(Rule(split_selectors(prelude), css[match.start():close + 1]))
+            continue
+        at = _AT_NAME.match(prelude)
+        name = at.group(1).lower() if at else ''
+        text = prelude + css[match.start():close + 1]
+        if name in GROUPING_RULES:
+            nodes.append(GroupingRule(prelude, parse_rules(css, match.end(), close)))
+        elif name == 'font-face' and _FONT_FAMILY.search(text):
+            nodes.append(NamedRule('font-face', _FONT_FAMILY.search(text).group(2).strip().lower(), text))
+        elif name.endswith('keyframes') and _KEYFRAMES_NAME.match(text):
+            nodes.append(NamedRule('keyframes', _KEYFRAMES_NAME.match(text).group(2), text))
+        else:
+            nodes.append(text)
+    return nodes
+
+
+class Stylesheet:
+    """A parsed stylesheet that can be cut down to what a page uses"""
+
+    def __init__(self, css: str, url: str = ''):
+        self.css = css
+        self.url = url
+        self.size = len(css.encode('utf-8'))
+        self.rules = parse_rules(css)
+
+    def subset(self, usage: PageUsage) -> str:
+        """The rules of the stylesheet that can match the page, in their original order"""
+        parts = self._kept(self.rules, usage)
+        used = set(_WORD.findall(''.join(self._rule_text(parts)).lower()))
+        text = ''.join(self._render(parts, used))
+        return _URL.sub(self._absolute_url, text) if self.url else text
+
+    def _kept(self, nodes: list, usage: PageUsage) -> list:
+        parts = []
+        for node in nodes:
+            if isinstance(node, Rule):
+                selectors = [selector for selector in node.selectors if selector_matches(selector, usage)]
+                if selectors:
+                    parts.append(','.join(selectors) + node.block)
+            elif isinstance(node, GroupingRule):
+                children = self._kept(node.children, usage)
+                if children:
+                    parts.append((node.prelude, children))
+            else:
+                parts.append(node)
+        return parts
+
+    def _rule_text(self, parts: list):
+        """The kept rules, without the @font-face and @keyframes they may name"""
+        for part in parts:
+            if isinstance(part, str):
+                yield part
+            elif isinstance(part, tuple):
+                yield from self._rule_text(part[1])
+
+    def _render(self, parts: list, used: set):
+        for part in parts:
+            if isinstance(part, str):
+                yield part
+            elif isinstance(part, NamedRule):
+                if all(word in used for word in _WORD.findall(part.name.lower())):
+                    yield part.text
+            else:
+                children = ''.join(self._render(part[1], used))
+                if children:
+                    yield part[0] + '{' + children + '}'
+
+    def _absolute_url(self, match) -> str:
+        ref = match.group(2).strip()
+        if ref.startswith(('data:', '#')) or _ABSOLUTE_URL.match(ref):
+            return match.group()
+        return f'url({match.group(1)}{urljoin(self.url, ref)}{match.group(1)})'
+
+
+def vendored_path(url: str, vendor_dir: str = VENDOR_DIR) -> str:
+    """Where the vendored copy of the stylesheet at url lives"""
+    return os.path.join(vendor_dir, url.rsplit('/', 1)[-1])
+
+
+def integrity_matches(body: bytes, integrity: str) -> bool:
+    """Whether body matches one of the hashes of a Subresource Integrity value"""
+    for token in integrity.split():
+        algorithm, _, digest = token.partition('-')
+        if algorithm in ('sha256', 'sha384', 'sha512'):
+            if base64.b64encode(hashlib.new(algorithm, body).digest()).decode('ascii') == digest:
+                return True
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def load_stylesheet(url: str, integrity: Optional[str] = None, vendor_dir: str = VENDOR_DIR) -> Stylesheet:
+    """The vendored copy of url, parsed once per process.
+
+    Raises OSError if there is no vendored copy and ValueError if it does
+    not match integrity (the cdnjs file the page links to).
+    """
+    with open(vendored_path(url, vendor_dir), 'rb') as f:
+        body = f.read()
+    if integrity and not integrity_matches(body, integrity):
+        raise ValueError(f"{vendored_path(url, vendor_dir)} does not match the integrity hash of {url}")
+    return Stylesheet(body.decode('utf-8'), url)
+
+
+def vendor_problems(stylesheets: dict, vendor_dir: str = VENDOR_DIR) -> list:
+    """What is wrong with the vendored copies of stylesheets (url -> integrity), one message each"""
+    problems = []
+    for url, integrity in stylesheets.items():
+        try:
+            load_stylesheet(url, integrity, vendor_dir)
+        except OSError:
+            problems.append(f"No vendored copy of {url.rsplit('/', 1)[-1]} at {vendored_path(url, vendor_dir)}")
+        except ValueError as e:
+            problems.append(str(e))
+    return problems
+
+
+def fetch(url: str, integrity: Optional[str] = None, vendor_dir: str = VENDOR_DIR) -> str:
+    """Download url into vendor_dir after checking it against integrity; the path written"""
+    with urllib.request.urlopen(url, timeout=30) as response:
+        body = response.read()
+    if integrity and not integrity_matches(body, integrity):
+        raise ValueError(f"{url} does not match its integrity hash")
+    path = vendored_path(url, vendor_dir)
+    os.makedirs(vendor_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=vendor_dir, prefix='.vendor-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(body)
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv: Optional[list] = None) -> int:
+    from modify_html import STYLESHEET_INTEGRITY
+
+    parser = argparse.ArgumentParser(description='Vendored copies of the injected stylesheets for --critical-css')
+    parser.add_argument('--fetch', action='store_true',
+                        help="download the missing or outdated copies from cdnjs (the only step that needs network)")
+    parser.add_argument('--vendor-dir', default=VENDOR_DIR, help=f"where the copies live (default: {VENDOR_DIR})")
+    args = parser.parse_args(argv)
+
+    failed = fetched = 0
+    for url, integrity in STYLESHEET_INTEGRITY.items():
+        path = vendored_path(url, args.vendor_dir)
+        try:
+            sheet = load_stylesheet(url, integrity, args.vendor_dir)
+            print(f"✓ {path}: {sheet.size:,} bytes, {len(sheet.rules):,} rules, integrity ok")
+            continue
+        except (OSError, ValueError) as e:
+            if not args.fetch:
+                print(f"✗ {e}")
+                failed += 1
+                continue
+        try:
+            fetch(url, integrity, args.vendor_dir)
+            print(f"✓ {path}: fetched from {url}")
+            fetched += 1
+        except (OSError, ValueError) as e:
+            print(f"✗ Could not fetch {url}: {e}")
+            failed += 1
+    if failed and not args.fetch:
+        print("Run python3 critical_css.py --fetch to vendor them")
+    elif fetched:
+        print(f"Commit {args.vendor_dir} so builds stay offline")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image dimensions for the image pass, read from a local mirror of the site.
+
+`image_size(path)` reads only as much of a file as its format needs to
+state its size: the header of PNG, GIF and WebP files, the markers of a
+JPEG up to its frame header (a JPEG whose EXIF orientation turns it on its
+side gets width and height swapped, as browsers display it), and the root
+element of an SVG (width/height in px, else its viewBox).
+
+`ImageSizes(mirror)` maps the root-relative image URLs of a page
+(/wp-content/uploads/...) to files below the mirror directory and keeps
+what it read per URL, so thousands of pages that share an image read it
+once; an entry is read again only when its file's size or mtime changes.
+"""
+
+import os
+import re
+import struct
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+_SVG_ROOT = re.compile(rb'<svg\b([^>]*)>', re.I)
+_SVG_ATTRIBUTE = re.compile(rb'\s(width|height|viewBox)\s*=\s*["\']([^"\']*)["\']', re.I)
+_SVG_LENGTH = re.compile(rb'\s*([0-9.]+)\s*(px)?\s*$')
+# EXIF orientations 5-8 rotate the image a quarter turn
+_QUARTER_TURNS = (5, 6, 7, 8)
+
+
+def _png(head: bytes, f) -> Optional[tuple]:
+    if head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    return None
+
+
+def _gif(head: bytes, f) -> Optional[tuple]:
+    return struct.unpack('<HH', head[6:10])
+
+
+def _webp(head: bytes, f) -> Optional[tuple]:
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L' and head[20:21] == b'\x2f':
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None
+
+
+def _exif_orientation(data: bytes) -> int:
+    """The Orientation tag of an APP1 Exif segment's payload (1 if absent)"""
+    if data[:6] != b'Exif\x00\x00' or data[6:8] not in (b'II', b'MM'):
+        return 1
+    order = '<' if data[6:8] == b'II' else '>'
+    tiff = data[6:]
+    try:
+        offset = struct.unpack(order + 'I', tiff[4:8])[0]
+        count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+        for i in range(count):
+            entry = tiff[offset + 2 + 12 * i:offset + 14 + 12 * i]
+            if struct.unpack(order + 'H', entry[:2])[0] == 0x0112:
+                return struct.unpack(order + 'H', entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg(head: bytes, f) -> Optional[tuple]:
+    f.seek(2)
+    orientation = 1
+    while True:
+        marker = f.read(2)
+        while marker[:1] == b'\xff' and marker[1:] == b'\xff':
+            # Fill bytes before a marker
+            marker = b'\xff' + f.read(1)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None
+        kind = marker[1]
+        if kind in (0xd8, 0x01) or 0xd0 <= kind <= 0xd7:
+            continue
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        size = struct.unpack('>H', length)[0] - 2
+        if kind == 0xe1 and orientation == 1:
+            orientation = _exif_orientation(f.read(size))
+            continue
+        # Frame headers: SOF0-SOF15 without DHT (c4), JPG (c8) and DAC (cc)
+        if 0xc0 <= kind <= 0xcf and kind not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return (height, width) if orientation in _QUARTER_TURNS else (width, height)
+        if kind == 0xda:
+            return None
+        f.seek(size, os.SEEK_CUR)
+
+
+def _svg(head: bytes, f) -> Optional[tuple]:
+    root = _SVG_ROOT.search(head + f.read(4096))
+    if root is None:
+        return None
+    attributes = {name.lower(): value for name, value in _SVG_ATTRIBUTE.findall(root.group(1))}
+    lengths = [_SVG_LENGTH.match(attributes.get(name, b'')) for name in (b'width', b'height')]
+    if all(lengths):
+        return tuple(round(float(length.group(1))) for length in lengths)
+    box = attributes.get(b'viewbox', b'').replace(b',', b' ').split()
+    if len(box) == 4:
+        return round(float(box[2])), round(float(box[3]))
+    return None
+
+
+def image_size(path: str) -> Optional[tuple]:
+    """(width, height) of an image file, or None if it is not a readable image"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                read = _png
+            elif head[:6] in (b'GIF87a', b'GIF89a'):
+                read = _gif
+            elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                read = _webp
+            elif head[:2] == b'\xff\xd8':
+                read = _jpeg
+            elif b'<svg' in head or head.lstrip().startswith(b'<?xml'):
+                read = _svg
+            else:
+                return None
+            size = read(head, f)
+    except (OSError, ValueError, struct.error):
+        return None
+    if size is None or not all(size):
+        return None
+    return size
+
+
+class ImageSizes:
+    """Image dimensions by URL, from files below a mirror of the site root"""
+
+    def __init__(self, mirror: str):
+        self.mirror = os.path.abspath(mirror)
+        self._sizes = {}    # url -> (size, mtime_ns, (width, height) or None)
+        self.reads = 0
+
+    def path(self, url: str) -> Optional[str]:
+        """The mirror file of a root-relative URL, or None for any other URL"""
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or not parts.path.startswith('/'):
+            return None
+        path = os.path.normpath(os.path.join(self.mirror, unquote(parts.path).lstrip('/')))
+        if not path.startswith(self.mirror + os.sep):
+            return None
+        return path
+
+    def size(self, url: str) -> Optional[tuple]:
+        """(width, height) of the image at url, or None if the mirror does not have it"""
+        path = self.path(url)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._sizes.get(url)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        self.reads += 1
+        size = image_size(path)
+        self._sizes[url] = (stat.st_size, stat.st_mtime_ns, size)
+        return size
+
+
+_mirrors = {}
+
+
+def image_sizes(mirror: str) -> ImageSizes:
+    """The process-wide ImageSizes of a mirror directory"""
+    key = os.path.abspath(mirror)
+    if key not in _mirrors:
+        _mirrors[key] = ImageSizes(key)
+    return _mirrors[key]
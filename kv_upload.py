@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cloudflare KV uploader for the FISG HTML Modifier System
+
+Python replacement for {working_directory}/upload-to-kv.js: pages go out
+over a small pool of keep-alive connections with a bounded number of
+requests in flight, 429/5xx answers are retried with exponential backoff,
+and --bulk packs many pages into one request to the KV bulk endpoint.
+Keys follow upload-to-kv.js: KV_KEY for en, KV_KEY:<lang> otherwise.
+
+`python3 kv_upload.py --serve 8787` runs a stand-in KV API on localhost;
+point "kv": {"api_base": "http://127.0.0.1:8787/client/v4"} at it to try
+an upload without touching Cloudflare.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import quote, unquote, urlsplit
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+from runlog import RunLog
+
+
+DEFAULT_API_BASE = 'https://api.cloudflare.com/client/v4'
+BULK_MAX_KEYS = 10000
+BULK_MAX_BYTES = 90 * 1024 * 1024   # the endpoint takes up to 100MB per request
+PUBLISH_MANIFEST_FILENAME = '.kv_publish_manifest.json'
+
+JS_CONSTANT = re.compile(r"const\s+(API_TOKEN|ACCOUNT_ID|NAMESPACE_ID)\s*=\s*['\"]([^'\"]*)['\"];")
+SETTINGS_ENV = {
+    'api_token': 'CLOUDFLARE_API_TOKEN',
+    'account_id': 'CLOUDFLARE_ACCOUNT_ID',
+    'namespace_id': 'CLOUDFLARE_KV_NAMESPACE_ID',
+}
+SETTINGS_JS = {'api_token': 'API_TOKEN', 'account_id': 'ACCOUNT_ID', 'namespace_id': 'NAMESPACE_ID'}
+
+
+def kv_key(base_key: str, lang_code: str) -> str:
+    """KV key of a language page, as in upload-to-kv.js"""
+    return base_key if lang_code == 'en' else f'{base_key}:{lang_code}'
+
+
+class KVSettings:
+    """Where to upload: account, namespace, token and API base URL.
+
+    Each value comes from the environment (CLOUDFLARE_API_TOKEN,
+    CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_KV_NAMESPACE_ID), else the "kv"
+    object of the campaign config, else the constants in the campaign's
+    upload-to-kv.js.
+    """
+
+    def __init__(self, account_id: str, namespace_id: str, api_token: str, api_base: str = DEFAULT_API_BASE):
+        self.account_id = account_id
+        self.namespace_id = namespace_id
+        self.api_token = api_token
+        self.api_base = api_base.rstrip('/')
+
+    @classmethod
+    def resolve(cls, config: Optional[dict] = None, js_path: Optional[str] = None) -> Optional['KVSettings']:
+        config = config or {}
+        constants = {}
+        if js_path and os.path.exists(js_path):
+            with open(js_path, 'r', encoding='utf-8') as f:
+                constants = dict(JS_CONSTANT.findall(f.read()))
+        values = {}
+        for name, env in SETTINGS_ENV.items():
+            values[name] = os.environ.get(env) or config.get(name) or constants.get(SETTINGS_JS[name])
+        if not all(values.values()):
+            return None
+        return cls(api_base=config.get('api_base') or DEFAULT_API_BASE, **values)
+
+    @property
+    def key(self) -> tuple:
+        return (self.api_base, self.account_id, self.namespace_id, self.api_token)
+
+    @property
+    def namespace(self) -> str:
+        """Identifies the target namespace (not the token) in the publish manifest"""
+        return f'{self.api_base}/accounts/{self.account_id}/namespaces/{self.namespace_id}'
+
+    @property
+    def namespace_path(self) -> str:
+        return f'{urlsplit(self.api_base).path}/accounts/{self.account_id}/storage/kv/namespaces/{self.namespace_id}'
+
+
+class PublishManifest:
+    """Per-working-directory record of what each KV key last received.
+
+    Entries are kept per target namespace, so publishing to a stand-in or
+    another namespace never marks the real one as up to date. A key whose
+    page hashes to the recorded value is skipped; only successful uploads
+    are recorded.
+    """
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self.namespaces = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, directory: str, settings: KVSettings) -> 'PublishManifest':
+        manifest = cls(os.path.join(directory, PUBLISH_MANIFEST_FILENAME), settings.namespace)
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                manifest.namespaces = json.load(f).get('namespaces', {})
+        except (FileNotFoundError, ValueError, AttributeError):
+            manifest.namespaces = {}
+        return manifest
+
+    @property
+    def entries(self) -> dict:
+        return self.namespaces.setdefault(self.namespace, {})
+
+    def is_current(self, key: str, page_hash: str) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry.get('hash') == page_hash
+
+    def record(self, key: str, page_hash: str, size: int) -> None:
+        self.entries[key] = {'hash': page_hash, 'bytes': size}
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        from modify_html import write_atomic
+
+        # Atomic, so an interrupted upload never leaves a truncated manifest behind
+        write_atomic(self.path, json.dumps({'namespaces': self.namespaces}, indent=2, sort_keys=True))
+        self.dirty = False
+
+
+def page_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class UploadResult:
+    """Outcome of one key"""
+
+    __slots__ = ('key', 'ok', 'size', 'attempts', 'error')
+
+    def __init__(self, key: str, ok: bool, size: int, attempts: int, error: Optional[str] = None):
+        self.key = key
+        self.ok = ok
+        self.size = size
+        self.attempts = attempts
+        self.error = error
+
+
+class KVClient:
+    """Keep-alive HTTP client for the KV API with bounded concurrency and retries.
+
+    Requests run on the client's pool of at most `concurrency` worker
+    threads, created on the first upload and kept until `close()`; each
+    thread keeps one persistent connection, so the client never holds more
+    than that many, however many uploads it runs.
+    A 429 or 5xx answer, or a dropped connection, is retried up to
+    `retries` times, waiting Retry-After if the server sent it and
+    otherwise `backoff` * 2^attempt seconds (capped, with jitter).
+    """
+
+    def __init__(self, settings: KVSettings, concurrency: int = 8, retries: int = 5, backoff: float = 0.5,
+                 max_backoff: float = 30.0, timeout: float = 60.0):
+        self.settings = settings
+        self.concurrency = max(concurrency, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        url = urlsplit(settings.api_base)
+        self._scheme = url.scheme
+        self._host = url.hostname
+        self._port = url.port
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._pool = None
+
+    # --- connections ------------------------------------------------------
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            factory = http.client.HTTPSConnection if self._scheme == 'https' else http.client.HTTPConnection
+            connection = factory(self._host, self._port, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    def __enter__(self) -> 'KVClient':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- requests ---------------------------------------------------------
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay + random.uniform(0, self.backoff)
+
+    def request(self, method: str, path: str, body: bytes, content_type: str) -> tuple:
+        """Send one request with retries; returns (attempts, status, parsed JSON body or None)"""
+        headers = {
+            'Authorization': f'Bearer {self.settings.api_token}',
+            'Content-Type': content_type,
+            'Content-Length': str(len(body)),
+        }
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            try:
+                connection = self._connection()
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = response.read()
+                status = response.status
+                retry_after = response.getheader('Retry-After')
+                if response.will_close:
+                    self._drop_connection()
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection()
+                status, payload = None, str(e).encode('utf-8')
+            retryable = status is None or status == 429 or status >= 500
+            if not retryable or attempt > self.retries:
+                try:
+                    data = json.loads(payload) if payload else None
+                except ValueError:
+                    data = None
+                if status is None:
+                    data = {'success': False, 'errors': [payload.decode('utf-8', 'replace')]}
+                return attempt, status, data
+            time.sleep(self._delay(attempt - 1, retry_after))
+
+    def put_value(self, key: str, content: str) -> UploadResult:
+        body = content.encode('utf-8')
+        path = f'{self.settings.namespace_path}/values/{quote(key, safe="")}'
+        attempts, status, data = self.request('PUT', path, body, 'text/plain')
+        if status == 200 and data and data.get('success'):
+            return UploadResult(key, True, len(body), attempts)
+        return UploadResult(key, False, len(body), attempts, _error_text(status, data))
+
+    def put_bulk(self, pages: list) -> list:
+        """Write (key, content) pairs in one bulk request; one result per key"""
+        body = json.dumps([{'key': key, 'value': content} for key, content in pages]).encode('utf-8')
+        attempts, status, data = self.request('PUT', f'{self.settings.namespace_path}/bulk', body,
+                                              'application/json')
+        sizes = [len(content.encode('utf-8')) for _, content in pages]
+        if not (status == 200 and data and data.get('success')):
+            error = _error_text(status, data)
+            return [UploadResult(key, False, size, attempts, error) for (key, _), size in zip(pages, sizes)]
+        rejected = set((data.get('result') or {}).get('unsuccessful_keys') or [])
+        return [UploadResult(key, key not in rejected, size, attempts, 'rejected by bulk write' if key in rejected else None)
+                for (key, _), size in zip(pages, sizes)]
+
+    def upload(self, pages: list, bulk: bool = False) -> list:
+        """Upload (key, content) pairs; returns UploadResults in input order"""
+        if not pages:
+            return []
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='kv-upload')
+        if not bulk:
+            return list(self._pool.map(lambda page: self.put_value(*page), pages))
+        results = []
+        for batch_results in self._pool.map(self.put_bulk, bulk_batches(pages)):
+            results.extend(batch_results)
+        return results
+
+
+def bulk_batches(pages: list, max_keys: int = BULK_MAX_KEYS, max_bytes: int = BULK_MAX_BYTES) -> list:
+    """Split (key, content) pairs into bulk requests under the key and size limits"""
+    batches = []
+    batch, size = [], 0
+    for key, content in pages:
+        page_size = len(content.encode('utf-8')) + len(key) + 32
+        if batch and (len(batch) >= max_keys or size + page_size > max_bytes):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append((key, content))
+        size += page_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _error_text(status: Optional[int], data: Optional[dict]) -> str:
+    errors = (data or {}).get('errors') or []
+    detail = '; '.join(e.get('message', str(e)) if isinstance(e, dict) else str(e) for e in errors)
+    return f"HTTP {status}: {detail}" if status is not None else (detail or 'connection failed')
+
+
+def report_uploads(results: list, skipped: Optional[list] = None, log: Optional[RunLog] = None) -> None:
+    """Log one line per uploaded key, then the unchanged keys that were skipped"""
+    log = log or RunLog()
+    for result in results:
+        if result.ok:
+            log.message('ok', f"Uploaded: {result.key} ({result.size} bytes)", key=result.key, size=result.size)
+        else:
+            log.message('failed', f"Failed: {result.key} ({result.error}, {result.attempts} attempts)",
+                        key=result.key, error=result.error, attempts=result.attempts)
+    if skipped:
+        size = sum(size for _, size in skipped)
+        log.message('ok', f"Skipped {len(skipped)} unchanged keys ({size} bytes)", skipped=len(skipped), size=size)
+
+
+# --- local stand-in for the KV API ----------------------------------------
+
+class StandInKVHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    VALUE_PATH = re.compile(r'/accounts/[^/]+/storage/kv/namespaces/[^/]+/values/([^/?]+)$')
+    BULK_PATH = re.compile(r'/accounts/[^/]+/storage/kv/namespaces/[^/]+/bulk$')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, data: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with server.lock:
+            server.requests += 1
+            throttled = server.fail_first > 0
+            if throttled:
+                server.fail_first -= 1
+        if throttled:
+            self._reply(429, {'success': False, 'errors': [{'message': 'rate limited'}]}, {'Retry-After': '0'})
+            return
+        if self.headers.get('Authorization') != f'Bearer {server.token}':
+            self._reply(403, {'success': False, 'errors': [{'message': 'bad token'}]})
+            return
+        value = self.VALUE_PATH.search(self.path)
+        if value:
+            with server.lock:
+                server.store[unquote(value.group(1))] = body.decode('utf-8')
+            self._reply(200, {'success': True, 'errors': []})
+        elif self.BULK_PATH.search(self.path):
+            pairs = json.loads(body)
+            with server.lock:
+                for pair in pairs:
+                    server.store[pair['key']] = pair['value']
+            self._reply(200, {'success': True, 'errors': [],
+                              'result': {'successful_key_count': len(pairs), 'unsuccessful_keys': []}})
+        else:
+            self._reply(404, {'success': False, 'errors': [{'message': 'not found'}]})
+
+
+class StandInKVServer(ThreadingHTTPServer):
+    """In-memory KV API on localhost for trying uploads without Cloudflare.
+
+    `store` holds the written values, `requests` counts requests, and the
+    first `fail_first` requests are answered 429 to exercise the retries.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, token: str = 'stand-in-token', fail_first: int = 0):
+        super().__init__(('127.0.0.1', port), StandInKVHandler)
+        self.token = token
+        self.fail_first = fail_first
+        self.store = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def api_base(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/client/v4'
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description='Cloudflare KV uploader / local stand-in server')
+    parser.add_argument('--serve', type=int, metavar='PORT', help="run the stand-in KV API on 127.0.0.1:PORT")
+    parser.add_argument('--token', default='stand-in-token', help="API token the stand-in accepts")
+    parser.add_argument('--fail-first', type=int, default=0, help="answer the first N requests with 429")
+    args = parser.parse_args(argv)
+    if args.serve is None:
+        parser.print_help()
+        return 1
+    server = StandInKVServer(args.serve, args.token, args.fail_first)
+    print(f"✓ Stand-in KV API at {server.api_base} (token: {args.token})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conservative HTML / CSS / JS minifier for the modified landing pages.
+
+Only whitespace and comments are removed; no name, value or token is ever
+rewritten, so the result behaves exactly like the input:
+
+- HTML: whitespace runs in text collapse to one character (a newline if the
+  run had one), whitespace runs inside tags outside attribute values
+  collapse to one space, comments are dropped except guarded ones
+  (`<!--! ... -->`, `<!--[if ...]>` conditional comments).
+- `<style>`: comments (except `/*! ... */`) are dropped and whitespace
+  around `{ } ; , : >` is removed.
+- `<script>`: comments (except `/*! ... */`) are dropped, indentation and
+  blank lines are removed and spaces next to punctuation are dropped.
+  Newlines that automatic semicolon insertion may depend on are kept, and
+  a script the scanner cannot follow is kept as is from that point on.
+- `{{...}}` placeholders and the contents of `<pre>`, `<textarea>` and
+  non-JavaScript `<script>` elements are copied as is.
+
+Every scanner moves forward with str.find / anchored matches, so the cost
+is linear in the page size, unclosed constructs included.
+"""
+
+import re
+
+PLACEHOLDER = re.compile(r'\{\{[^{}\n]*\}\}')
+
+# HTML
+_MARKUP = re.compile(r'<!--|</?[A-Za-z]|\{\{')
+_TAG_NAME = re.compile(r'[^\s/<>]*')
+_TAG_STOP = re.compile(r'[<>=]')
+_TAG_PARTS = re.compile(r'[ \t\n\r\f]*=[ \t\n\r\f]*("[^"]*"|\'[^\']*\')|[ \t\n\r\f]+')
+_HTML_SPACE = re.compile(r'[ \t\n\r\f]+')
+_GUARDED_COMMENT = re.compile(r'<!--(?:!|\[if\b|<!)')
+RAW_TEXT_ELEMENTS = ('pre', 'textarea', 'script', 'style')
+_RAW_CLOSE = {name: re.compile(rf'</{name}[ \t\n\r\f]*>', re.I) for name in RAW_TEXT_ELEMENTS}
+_SCRIPT_TYPE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]*)', re.I)
+JS_TYPES = ('', 'text/javascript', 'application/javascript', 'module')
+
+# CSS
+_CSS_SPACE = re.compile(r'[ \t\n\r\f]+')
+_CSS_SPECIAL = re.compile(r'["\']|/\*|\{\{')
+_CSS_TIGHT = re.compile(r' ?([{};,>]) ?|(:) ')
+
+# JS
+_JS_WORD = re.compile(r'[\w$]+')
+_JS_SPACE = re.compile(r'\s+')
+_JS_PUNCT = frozenset('{}()[];,=:<>!&|?*%^~+-')
+# A newline after / before these never ends a statement
+_JS_NEWLINE_AFTER = frozenset('{;,([=|&?:')
+_JS_NEWLINE_BEFORE = frozenset('})],;?:')
+_JS_REGEX_AFTER = frozenset('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = frozenset(('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void',
+                                'throw', 'instanceof', 'yield', 'await'))
+
+
+def _collapse_text(text: str) -> str:
+    return _HTML_SPACE.sub(lambda m: '\n' if '\n' in m.group() else ' ', text)
+
+
+def _collapse_tag(tag: str) -> str:
+    tag = _TAG_PARTS.sub(lambda m: '=' + m.group(1) if m.group(1) else ' ', tag)
+    return tag[:-2] + '>' if tag.endswith(' >') else tag
+
+
+class _TagScanner:
+    """Finds where a tag ends: at the first '>' outside a quoted attribute value.
+
+    A quote that is never closed is remembered, so later tags do not search
+    the rest of the page for it again.
+    """
+
+    def __init__(self, html: str):
+        self.html = html
+        self.unclosed_after = {}
+
+    def end(self, pos: int) -> int:
+        """Index after the '>' closing the tag whose name ends at pos, or -1"""
+        html = self.html
+        length = len(html)
+        i = pos
+        while i < length:
+            stop = _TAG_STOP.search(html, i)
+            if stop is None:
+                return -1
+            char = stop.group()
+            if char == '>':
+                return stop.end()
+            if char == '<':
+                return -1
+            i = stop.end()
+            if char == '=':
+                while i < length and html[i] in ' \t\n\r\f':
+                    i += 1
+                if i < length and html[i] in '"\'':
+                    quote = html[i]
+                    if i >= self.unclosed_after.get(quote, length):
+                        return -1
+                    close = html.find(quote, i + 1)
+                    if close < 0:
+                        self.unclosed_after[quote] = i
+                        return -1
+                    i = close + 1
+        return -1
+
+
+def minify_html(html: str) -> str:
+    """Minify a whole page (see the module docstring for what is removed)"""
+    out = []
+    text = []
+    pos = 0
+    length = len(html)
+    tags = _TagScanner(html)
+
+    def flush():
+        if text:
+            out.append(_collapse_text(''.join(text)))
+            text.clear()
+
+    while pos < length:
+        match = _MARKUP.search(html, pos)
+        if match is None:
+            text.append(html[pos:])
+            break
+        start = match.start()
+        text.append(html[pos:start])
+        opener = match.group()
+
+        if opener == '<!--':
+            end = html.find('-->', start + 4)
+            end = length if end < 0 else end + 3
+            if _GUARDED_COMMENT.match(html, start):
+                flush()
+                out.append(html[start:end])
+            pos = end
+            continue
+
+        if opener == '{{':
+            placeholder = PLACEHOLDER.match(html, start)
+            if placeholder is None:
+                text.append(opener)
+                pos = start + 2
+                continue
+            flush()
+            out.append(placeholder.group())
+            pos = placeholder.end()
+            continue
+
+        name_end = _TAG_NAME.match(html, match.end()).end()
+        end = tags.end(name_end)
+        if end < 0:
+            # A '<' that never closes is text
+            text.append('<')
+            pos = start + 1
+            continue
+        flush()
+        tag = html[start:end]
+        out.append(_collapse_tag(tag))
+        pos = end
+        name = html[match.end() - 1:name_end].lower()
+        if opener[1] == '/' or name not in _RAW_CLOSE:
+            continue
+
+        close = _RAW_CLOSE[name].search(html, pos)
+        end = length if close is None else close.start()
+        body = html[pos:end]
+        if name == 'style':
+            body = minify_css(body)
+        elif name == 'script' and _script_type(tag) in JS_TYPES:
+            body = minify_js(body)
+        out.append(body)
+        if close is not None:
+            out.append(close.group())
+        pos = close.end() if close is not None else length
+
+    flush()
+    return ''.join(out)
+
+
+def _script_type(tag: str) -> str:
+    match = _SCRIPT_TYPE.search(tag)
+    return match.group(1).lower() if match else ''
+
+
+def _skip_string(code: str, pos: int, quote: str) -> int:
+    """End of the string literal opening at pos (an unterminated one ends at the newline)"""
+    i = pos + 1
+    length = len(code)
+    while i < length:
+        char = code[i]
+        if char == '\\':
+            i += 2
+        elif char == quote:
+            return i + 1
+        elif char == '\n':
+            return i
+        else:
+            i += 1
+    return length
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and insignificant whitespace from a style sheet"""
+    out = []
+    chunk = []
+    pos = 0
+    length = len(css)
+
+    def flush():
+        if chunk:
+            code = _CSS_SPACE.sub(' ', ''.join(chunk))
+            out.append(_CSS_TIGHT.sub(lambda m: m.group(1) or m.group(2), code).replace(';}', '}'))
+            chunk.clear()
+
+    while pos < length:
+        special = _CSS_SPECIAL.search(css, pos)
+        if special is None:
+            chunk.append(css[pos:])
+            break
+        chunk.append(css[pos:special.start()])
+        pos = special.start()
+        char = css[pos]
+        if char in '"\'':
+            end = _skip_string(css, pos, char)
+            flush()
+            out.append(css[pos:end])
+            pos = end
+        elif css.startswith('/*', pos):
+            end = css.find('*/', pos + 2)
+            end = length if end < 0 else end + 2
+            if css.startswith('/*!', pos):
+                flush()
+                out.append(css[pos:end])
+            else:
+                chunk.append(' ')
+            pos = end
+        elif PLACEHOLDER.match(css, pos):
+            end = PLACEHOLDER.match(css, pos).end()
+            flush()
+            out.append(css[pos:end])
+            pos = end
+        else:
+            chunk.append('{{')
+            pos += 2
+    flush()
+    return ''.join(out).strip()
+
+
+def _skip_template(code: str, pos: int) -> int:
+    """End of the template literal opening at pos, `${...}` substitutions included"""
+    i = pos + 1
+    length = len(code)
+    while i < length:
+        char = code[i]
+        if char == '\\':
+            i += 2
+        elif char == '`':
+            return i + 1
+        elif code.startswith('${', i):
+            i = _skip_substitution(code, i + 2)
+        else:
+            i += 1
+    return length
+
+
+def _skip_substitution(code: str, pos: int) -> int:
+    """End of a `${...}` substitution whose body starts at pos"""
+    depth = 1
+    i = pos
+    length = len(code)
+    while i < length:
+        char = code[i]
+        if char in '"\'':
+            i = _skip_string(code, i, char)
+        elif char == '`':
+            i = _skip_template(code, i)
+        elif char == '{':
+            depth += 1
+            i += 1
+        elif char == '}':
+            depth -= 1
+            i += 1
+            if depth == 0:
+                return i
+        else:
+            i += 1
+    return length
+
+
+def _skip_regex(code: str, pos: int) -> int:
+    """End of the regular expression literal opening at pos, or -1 if there is none"""
+    i = pos + 1
+    length = len(code)
+    in_class = False
+    while i < length:
+        char = code[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '\n':
+            return -1
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            flags = _JS_WORD.match(code, i + 1)
+            return flags.end() if flags else i + 1
+        i += 1
+    return -1
+
+
+def _regex_allowed(tokens: list) -> bool:
+    """Whether a '/' after these tokens starts a regular expression rather than a division"""
+    for token in reversed(tokens):
+        if token.isspace():
+            continue
+        return token[-1] in _JS_REGEX_AFTER or token in _JS_REGEX_KEYWORDS
+    return True
+
+
+def _js_tokens(code: str) -> list:
+    """Split a script into tokens; comments become whitespace tokens.
+
+    A '/' where a regular expression may start but none closes on the line
+    ends the scan: the rest of the script becomes one verbatim token.
+    """
+    tokens = []
+    pos = 0
+    length = len(code)
+    while pos < length:
+        char = code[pos]
+        if char.isspace():
+            end = _JS_SPACE.match(code, pos).end()
+        elif char in '"\'':
+            end = _skip_string(code, pos, char)
+        elif char == '`':
+            end = _skip_template(code, pos)
+        elif code.startswith('//', pos):
+            end = code.find('\n', pos)
+            end = length if end < 0 else end
+            tokens.append(' ')
+            pos = end
+            continue
+        elif code.startswith('/*', pos):
+            end = code.find('*/', pos + 2)
+            end = length if end < 0 else end + 2
+            if code.startswith('/*!', pos):
+                tokens.append(code[pos:end])
+            else:
+                tokens.append('\n' if '\n' in code[pos:end] else ' ')
+            pos = end
+            continue
+        elif char == '/' and _regex_allowed(tokens):
+            end = _skip_regex(code, pos)
+            if end < 0:
+                # Not the script we think it is: keep the rest as is
+                tokens.append(code[pos:])
+                break
+        elif code.startswith('{{', pos) and PLACEHOLDER.match(code, pos):
+            end = PLACEHOLDER.match(code, pos).end()
+        else:
+            word = _JS_WORD.match(code, pos)
+            end = word.end() if word else pos + 1
+        tokens.append(code[pos:end])
+        pos = end
+    return tokens
+
+
+def _join(before: str, after: str) -> bool:
+    """Whether the whitespace between two characters can be dropped"""
+    if before in '+-' and after in '+-':
+        return False
+    if '/' in (before, after) or (before == '<' and after == '!'):
+        return False
+    return before in _JS_PUNCT or after in _JS_PUNCT
+
+
+def minify_js(code: str) -> str:
+    """Drop comments, indentation and insignificant whitespace from a script"""
+    tokens = _js_tokens(code)
+    out = []
+    pending = ''
+    for token in tokens:
+        if token.isspace():
+            pending += token
+            continue
+        if pending and out:
+            before, after = out[-1][-1], token[0]
+            if '\n' in pending:
+                if not (before in _JS_NEWLINE_AFTER or after in _JS_NEWLINE_BEFORE) or not _join(before, after):
+                    out.append('\n')
+            elif not _join(before, after):
+                out.append(' ')
+        pending = ''
+        out.append(token)
+    return ''.join(out)
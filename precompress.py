@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precompressed artifacts for the FISG HTML Modifier System
+
+Writes index.html.gz (and index.html.zst when a zstd binding is available)
+at maximum compression next to each processed page, so the serving side
+can hand out the stored body instead of compressing it on every request.
+
+An artifact carries the mtime of the page it was made from; while the two
+match, the artifact is current and is not rebuilt. Pages are compressed
+on a thread pool (zlib and zstd release the GIL while they work).
+
+`python3 precompress.py example/*/index.html` compresses pages directly.
+"""
+
+import os
+import sys
+import gzip
+import argparse
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from runlog import RunLog
+
+try:
+    from compression import zstd as _zstd       # Python 3.14+
+except ImportError:
+    _zstd = None
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output identical for identical pages
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    if _zstd is not None:
+        level = _zstd.CompressionParameter.compression_level.bounds()[1]
+        return _zstd.compress(data, level=level)
+    return _zstandard.ZstdCompressor(level=_zstandard.MAX_COMPRESSION_LEVEL).compress(data)
+
+
+# (encoding, file suffix, compress function) in report order
+CODECS = [('gzip', '.gz', _gzip)]
+if _zstd is not None or _zstandard is not None:
+    CODECS.append(('zstd', '.zst', _zstd_compress))
+
+
+class Artifact:
+    """Outcome of one compressed file"""
+
+    __slots__ = ('path', 'encoding', 'size', 'original', 'written', 'error')
+
+    def __init__(self, path: str, encoding: str, size: int, original: int, written: bool,
+                 error: Optional[str] = None):
+        self.path = path
+        self.encoding = encoding
+        self.size = size
+        self.original = original
+        self.written = written
+        self.error = error
+
+    @property
+    def ratio(self) -> float:
+        return self.size / self.original if self.original else 0.0
+
+
+def is_current(source: str, artifact: str) -> bool:
+    """Whether `artifact` was made from `source` as it is now (same mtime)"""
+    try:
+        return os.stat(artifact).st_mtime_ns == os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def write_artifact(path: str, data: bytes, source_stat: os.stat_result) -> None:
+    """Atomically write `data` to `path` with the permissions and mtime of the page (source_stat)"""
+    from modify_html import write_atomic
+
+    write_atomic(path, data, like=source_stat)
+
+
+def compress_page(source: str, force: bool = False) -> list:
+    """Build every missing or stale artifact of one page; returns one Artifact per codec"""
+    artifacts = []
+    data = None
+    for encoding, suffix, compress in CODECS:
+        path = source + suffix
+        try:
+            if not force and is_current(source, path):
+                original = os.path.getsize(source)
+                artifacts.append(Artifact(path, encoding, os.path.getsize(path), original, False))
+                continue
+            if data is None:
+                source_stat = os.stat(source)
+                with open(source, 'rb') as f:
+                    data = f.read()
+            body = compress(data)
+            write_artifact(path, body, source_stat)
+            artifacts.append(Artifact(path, encoding, len(body), len(data), True))
+        except OSError as e:
+            artifacts.append(Artifact(path, encoding, 0, 0, False, str(e)))
+    return artifacts
+
+
+def compress_pages(sources: list, jobs: int = 4, force: bool = False) -> list:
+    """compress_page for every page on `jobs` threads; results in page order"""
+    if jobs <= 1 or len(sources) <= 1:
+        return [compress_page(source, force) for source in sources]
+    with ThreadPoolExecutor(max_workers=min(jobs, len(sources))) as pool:
+        return list(pool.map(lambda source: compress_page(source, force), sources))
+
+
+def report_artifacts(results: list, labels: list, log: Optional[RunLog] = None) -> None:
+    """Log one line per page (labelled by `labels`) with the size and ratio of each artifact, then the totals"""
+    log = log or RunLog()
+    totals = {}
+    for label, artifacts in zip(labels, results):
+        cells = []
+        failed = [artifact for artifact in artifacts if artifact.error]
+        for artifact in artifacts:
+            if artifact.error:
+                continue
+            state = 'written' if artifact.written else 'current'
+            cells.append(f"{artifact.encoding} {artifact.size:,} bytes ({artifact.ratio:.1%}, {state})")
+            total = totals.setdefault(artifact.encoding, [0, 0, 0])
+            total[0] += artifact.size
+            total[1] += artifact.original
+            total[2] += artifact.written
+        original = max((artifact.original for artifact in artifacts), default=0)
+        if cells:
+            log.message('ok', f"{label}: {original:,} bytes → " + ', '.join(cells), page=label)
+        for artifact in failed:
+            log.message('failed', f"{label}: {artifact.encoding} failed ({artifact.error})",
+                        page=label, encoding=artifact.encoding)
+    for encoding, (size, original, written) in totals.items():
+        ratio = size / original if original else 0.0
+        log.text(f"  {encoding}: {original:,} → {size:,} bytes ({ratio:.1%}), {written} written")
+    if not any(encoding == 'zstd' for encoding, _, _ in CODECS):
+        log.message('warning', "zstd skipped: needs Python 3.14+ (compression.zstd) or the zstandard package")
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description='Write .gz/.zst artifacts next to processed pages')
+    parser.add_argument('pages', nargs='+', help="pages to compress")
+    parser.add_argument('--jobs', type=int, default=4, metavar='N', help="compress N pages at once (default: 4)")
+    parser.add_argument('--force', action='store_true', help="rebuild artifacts that are already current")
+    args = parser.parse_args(argv)
+    results = compress_pages(args.pages, args.jobs, args.force)
+    report_artifacts(results, args.pages)
+    return 1 if any(artifact.error for artifacts in results for artifact in artifacts) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run log for the FISG HTML Modifier System
+
+Steps report typed outcomes instead of printing: `log.ok(message)`,
+`log.warning(message)` and `log.failed(message)` on a StepLog, which keeps
+one StepResult per step (opened with `capture(step)`) plus the page-level
+notes recorded between steps. A page's StepLog is buffered until the page
+is done and then written by RunLog as one record, in one write:
+
+    text   the ✓ / ⚠ / ✗ block modify_html.py has always printed
+    json   one JSON line per page: labels, status, steps, notes, wall_ms
+
+RunLog's level picks what is written: 'info' everything, 'warning' (quiet)
+only pages and lines with a ⚠ or ✗, 'debug' adds step times, and 'off'
+hands out NULL_LOG, whose methods do nothing, so a disabled log costs a
+method call per outcome and nothing else.
+"""
+
+import sys
+import json
+import time
+import contextlib
+from typing import Optional
+
+OK, WARNING, FAILED = 'ok', 'warning', 'failed'
+SEVERITY = (OK, WARNING, FAILED)
+SYMBOLS = {OK: '✓', WARNING: '⚠', FAILED: '✗'}
+
+LEVELS = ('debug', 'info', 'warning', 'error', 'off')
+# The lowest level an outcome of each status is still written at
+STATUS_LEVEL = {OK: 'info', WARNING: 'warning', FAILED: 'error'}
+
+BANNER = '=' * 60
+
+
+def worst(statuses) -> str:
+    """The most severe of statuses ('ok' if there are none)"""
+    return max(statuses, key=SEVERITY.index, default=OK)
+
+
+class StepResult:
+    """What one step reported: a status per line, and the worst of them.
+
+    status is 'failed' if any line failed, else 'warning' if any line is a
+    warning, else 'ok'. messages are the reported lines without a status.
+    """
+
+    __slots__ = ('step', 'status', 'lines', 'wall_ms')
+
+    SYMBOLS = SYMBOLS
+    SEVERITY = SEVERITY
+
+    def __init__(self, step: str, status: str = OK, lines: Optional[list] = None, wall_ms: float = 0.0):
+        self.step = step
+        self.status = status
+        self.lines = lines or []
+        self.wall_ms = wall_ms
+
+    @property
+    def messages(self) -> list:
+        return [message for _, message in self.lines]
+
+    def add(self, status: str, message: str) -> None:
+        self.lines.append((status, message))
+        if SEVERITY.index(status) > SEVERITY.index(self.status):
+            self.status = status
+
+    def to_dict(self) -> dict:
+        return {'step': self.step, 'status': self.status, 'messages': self.messages, 'wall_ms': self.wall_ms}
+
+
+class StepLog:
+    """Typed outcomes of one page, in the order they were reported.
+
+    `capture(step)` wraps one step: what it reports goes to that step's
+    StepResult, and its wall time is recorded. Outcomes reported outside a
+    step (stamp checks, "saved") are page-level notes. `entries` keeps
+    both in order; `results` holds the StepResults alone. `details` are
+    extra record fields (a --dry-run 'diff'). The log is plain data, so a
+    worker process can hand it back to the parent.
+    """
+
+    enabled = True
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.entries = []
+        self.details = {}
+        self._current = None
+        self._started = time.perf_counter()
+        self.wall_ms = 0.0
+
+    @property
+    def results(self) -> list:
+        return [entry for entry in self.entries if isinstance(entry, StepResult)]
+
+    @property
+    def notes(self) -> list:
+        return [entry for entry in self.entries if not isinstance(entry, StepResult)]
+
+    @property
+    def status(self) -> str:
+        return worst(entry.status if isinstance(entry, StepResult) else entry[0] for entry in self.entries)
+
+    @contextlib.contextmanager
+    def capture(self, step: str):
+        result = StepResult(step)
+        self.entries.append(result)
+        previous, self._current = self._current, result
+        started = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result.wall_ms = round((time.perf_counter() - started) * 1000, 3)
+            self._current = previous
+
+    def add(self, status: str, message: str) -> None:
+        if self._current is not None:
+            self._current.add(status, message)
+        else:
+            self.entries.append((status, message))
+
+    def ok(self, message: str) -> None:
+        self.add(OK, message)
+
+    def warning(self, message: str) -> None:
+        self.add(WARNING, message)
+
+    def failed(self, message: str) -> None:
+        self.add(FAILED, message)
+
+    def finish(self) -> 'StepLog':
+        """Stop the page clock"""
+        self.wall_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        return self
+
+    def to_dict(self) -> dict:
+        return dict(self.labels, type='page', status=self.status,
+                    steps=[result.to_dict() for result in self.results],
+                    notes=[{'status': status, 'message': message} for status, message in self.notes],
+                    wall_ms=self.wall_ms, **self.details)
+
+
+class PrintLog(StepLog):
+    """A StepLog that also prints each outcome as it is reported.
+
+    The default of an HTMLModifier used on its own, so calling a step
+    directly still shows its ✓ / ⚠ / ✗ line.
+    """
+
+    def add(self, status: str, message: str) -> None:
+        indent = '  ' if self._current is not None else ''
+        print(f"{indent}{SYMBOLS[status]} {message}")
+        super().add(status, message)
+
+
+class NullLog(StepLog):
+    """The StepLog of a disabled RunLog: records nothing"""
+
+    enabled = False
+
+    def capture(self, step: str):
+        return contextlib.nullcontext()
+
+    def add(self, status: str, message: str) -> None:
+        pass
+
+
+NULL_LOG = NullLog()
+
+
+class RunLog:
+    """Writes one record per page, and the run's own messages, at a level and format.
+
+    `page(**labels)` starts a page's StepLog; `write_page(page)` writes it
+    as one record when the page is done. With `collecting()` pages are kept
+    in `pages` instead of written, for a worker to return to the parent,
+    which writes them in task order. Step outcomes of every written page
+    are counted in `step_counts` (step -> status -> count).
+
+    stream None means the current sys.stdout, so a RunLog pickled into a
+    worker writes to the worker's stdout.
+    """
+
+    def __init__(self, level: str = 'info', format: str = 'text', stream=None):
+        if level not in LEVELS:
+            raise ValueError(f'unknown log level: {level}')
+        if format not in ('text', 'json'):
+            raise ValueError(f'unknown log format: {format}')
+        self.level = level
+        self.format = format
+        self.stream = stream
+        self.pages = None
+        self.step_counts = {}
+
+    def __getstate__(self) -> dict:
+        return dict(self.__dict__, stream=None, pages=None, step_counts={})
+
+    @property
+    def enabled(self) -> bool:
+        return self.level != 'off'
+
+    def shows(self, status: str) -> bool:
+        return LEVELS.index(STATUS_LEVEL[status]) >= LEVELS.index(self.level)
+
+    def collecting(self) -> 'RunLog':
+        """A copy that keeps the pages it is given instead of writing them"""
+        log = RunLog(self.level, self.format, self.stream)
+        log.pages = []
+        return log
+
+    def page(self, **labels) -> StepLog:
+        return StepLog(**labels) if self.enabled else NULL_LOG
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+
+    def write_page(self, page: StepLog) -> None:
+        if not page.enabled:
+            return
+        if self.pages is not None:
+            self.pages.append(page)
+            return
+        for result in page.results:
+            counts = self.step_counts.setdefault(result.step, dict.fromkeys(SEVERITY, 0))
+            counts[result.status] += 1
+        if not self.shows(page.status):
+            return
+        if self.format == 'json':
+            self.write(json.dumps(page.to_dict(), ensure_ascii=False) + '\n')
+        else:
+            self.write(self.render_page(page))
+
+    def render_page(self, page: StepLog) -> str:
+        """A page as the text block modify_html.py prints"""
+        debug = self.level == 'debug'
+        language = page.labels.get('language')
+        # Language pages get the banner; other pages (validate.py) a title line
+        verbose = language is not None and LEVELS.index(self.level) <= LEVELS.index('info')
+        if verbose:
+            lines = ['', BANNER, f"Processing: {language.upper()}", BANNER]
+        elif language is not None:
+            campaign = page.labels.get('campaign')
+            lines = [f"{campaign}/{language}:" if campaign else f"{language.upper()}:"]
+        else:
+            lines = [f"{page.labels.get('page')}:"]
+        in_steps = False
+        for i, entry in enumerate(page.entries):
+            if isinstance(entry, StepResult):
+                # Modification steps run before any page note, so only they get the header;
+                # a step after a note (validate on a skipped or saved page) gets a blank line
+                if verbose and not in_steps:
+                    lines += ['', 'Applying modifications...', ''] if i == 0 else ['']
+                in_steps = True
+                shown = [f"  {SYMBOLS[status]} {message}" for status, message in entry.lines if self.shows(status)]
+                if debug and shown:
+                    shown[0] += f" ({entry.wall_ms:.2f} ms)"
+                lines += shown
+                continue
+            in_steps = False
+            status, message = entry
+            if self.shows(status):
+                lines += ['', f"{SYMBOLS[status]} {message}"] if verbose else [f"{SYMBOLS[status]} {message}"]
+        if debug:
+            lines.append(f"  {len(page.results)} steps, {page.wall_ms:.2f} ms")
+        return '\n'.join(lines) + '\n' + page.details.get('diff', '')
+
+    def message(self, status: str, text: str, **fields) -> None:
+        """One line about the run itself (config, summary), not about a page"""
+        if not self.shows(status):
+            return
+        if self.format == 'json':
+            self.write(json.dumps(dict(fields, type='message', status=status, message=text), ensure_ascii=False)
+                       + '\n')
+        else:
+            self.write(f"{SYMBOLS[status]} {text}\n")
+
+    def section(self, title: str) -> None:
+        """A banner in text mode at info level and below"""
+        if self.format == 'text' and LEVELS.index(self.level) <= LEVELS.index('info'):
+            self.write(f"\n{BANNER}\n{title}\n{BANNER}\n")
+
+    def text(self, text: str) -> None:
+        """Free text in text mode at info level and below (banner bodies, tables)"""
+        if self.format == 'text' and LEVELS.index(self.level) <= LEVELS.index('info'):
+            self.write(text + '\n')
+
+    def summary(self, pages: dict) -> None:
+        """The closing record: each page's success by label, plus the step counts"""
+        if not self.enabled:
+            return
+        if self.format == 'json':
+            self.write(json.dumps({'type': 'summary', 'pages': pages, 'steps': self.step_counts},
+                                  ensure_ascii=False) + '\n')
+            return
+        totals = dict.fromkeys(SEVERITY, 0)
+        for counts in self.step_counts.values():
+            for status, count in counts.items():
+                totals[status] += count
+        if self.shows(OK) or totals[WARNING] or totals[FAILED]:
+            self.write(f"Steps: {totals[OK]} ok, {totals[WARNING]} warning, {totals[FAILED]} failed\n")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local HTTP transform service for the FISG HTML Modifier System
+
+`python3 service.py --port 8750` serves modify_html.transform on localhost,
+so a CMS or preview tool can get a modified page without touching files:
+
+    POST /transform?name=...&minify=1&assets=external&optimize_head=1
+        body: the page (text/html); answer: the modified page, with the
+        step outcome in X-Fxleader-Status / X-Fxleader-Steps headers
+    POST /transform   (Content-Type: application/json)
+        body: {"html": ..., "config": {...}}
+        answer: the TransformResult as JSON, page and per-step results
+    GET /assets/<file>   a shared asset linked by "assets": "external" pages
+    GET /health
+
+Settings not given in the request come from config.json (the top-level
+keys merged with the --campaign entry). Pages are transformed on a pool of
+worker processes that are started and warmed up (rules compiled, modifier
+version and shared assets computed, a sample page run through every
+step) before the first request is accepted, so no request pays for
+start-up or for another request's parse.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from urllib.parse import parse_qsl, urlsplit
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from countries import load_countries
+from modify_html import MODIFIER_OPTIONS, modifier_version, shared_assets, transform
+
+DEFAULT_PORT = 8750
+MAX_BODY_BYTES = 16 * 1024 * 1024
+ASSET_TYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8'}
+
+# Touches every step (and the post steps) once per worker
+WARM_UP_PAGE = (
+    '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n'
+    '<link rel="icon" href="https://www.fisg.com//favicon.png">\n<style>\ndialog { margin: 0; }\n</style>\n'
+    '</head>\n<body>\n<a href="https://www.fisg.com/join"><img src="https://www.fisg.com/a.png"></a>\n'
+    '<form action="#">\n<select name="country" id="country" required></select>\n'
+    '<button type="submit">Join</button>\n</form>\n'
+    '<dialog class="dialog">\n<div class="dialog-card"><p>Thanks</p>\n'
+    '<button class="dialog-close">x</button></div>\n</dialog>\n</body>\n</html>\n'
+)
+
+
+def warm_up() -> None:
+    """Pool initializer: pay every one-time cost before the first request"""
+    modifier_version()
+    try:
+        load_countries()
+    except (OSError, ValueError):
+        pass
+    for minify in (False, True):
+        for lazy_crypto in (False, True):
+            shared_assets(minify, lazy_crypto)
+    transform(WARM_UP_PAGE, {'name': 'warm-up'})
+    transform(WARM_UP_PAGE, {'name': 'warm-up', 'minify': True, 'assets': 'external', 'optimize_head': True,
+                             'lazy_crypto': True})
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def load_defaults(path: str, campaign: Optional[str] = None) -> dict:
+    """Settings of one campaign of config.json: the top-level keys merged with
+    the entry named `campaign` (or the first entry)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    shared = {key: value for key, value in config.items() if key != 'campaigns'}
+    entries = config.get('campaigns') or [{}]
+    if campaign is not None:
+        entries = [entry for entry in entries if dict(shared, **entry).get('name') == campaign]
+        if not entries:
+            raise ValueError(f"no campaign named {campaign!r} in {path}")
+    return dict(shared, **entries[0])
+
+
+def query_config(query: dict) -> dict:
+    """Campaign settings given as query parameters (minify=1, assets=external, ...)"""
+    config = {}
+    for key in ('name', 'working_directory') + MODIFIER_OPTIONS:
+        if key not in query:
+            continue
+        value = query[key]
+        if key in ('minify', 'optimize_images', 'critical_css', 'optimize_head', 'lazy_crypto', 'prerender_countries'):
+            value = value.lower() in ('1', 'true', 'yes', 'on')
+        elif key == 'url_hosts':
+            value = [host for host in value.split(',') if host]
+        elif key == 'url_attributes':
+            value = json.loads(value)
+        config[key] = value
+    return config
+
+
+class TransformHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY the
+    # body waits for the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, status: int, data: dict) -> None:
+        self._reply(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._reply_json(200, {'status': 'ok', 'workers': self.server.workers,
+                                   'modifier_version': modifier_version()})
+            return
+        if path.startswith('/assets/'):
+            filename = path[len('/assets/'):]
+            for minify in (False, True):
+                for lazy_crypto in (False, True):
+                    bodies = dict(shared_assets(minify, lazy_crypto).values())
+                    if filename in bodies:
+                        self._reply(200, bodies[filename].encode('utf-8'),
+                                    ASSET_TYPES[os.path.splitext(filename)[1]],
+                                    {'Cache-Control': 'public, max-age=31536000, immutable'})
+                        return
+        self._reply_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        if url.path != '/transform':
+            self.rfile.read(length)
+            self._reply_json(404, {'error': 'not found'})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._reply_json(413, {'error': f'page larger than {MAX_BODY_BYTES} bytes'})
+            return
+        body = self.rfile.read(length)
+        query = dict(parse_qsl(url.query))
+        as_json = self.headers.get('Content-Type', '').split(';')[0].strip() == 'application/json'
+        try:
+            if as_json:
+                request = json.loads(body)
+                html, config = request['html'], request.get('config') or {}
+            else:
+                html, config = body.decode('utf-8'), query_config(query)
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply_json(400, {'error': str(e)})
+            return
+
+        try:
+            result = self.server.transform(html, dict(self.server.defaults, **config))
+        except Exception as e:
+            self._reply_json(500, {'error': f'{type(e).__name__}: {e}'})
+            return
+
+        if as_json:
+            self._reply_json(200, result.to_dict())
+            return
+        counts = result.counts()
+        self._reply(200, result.html.encode('utf-8'), 'text/html; charset=utf-8', {
+            'X-Fxleader-Status': result.status,
+            'X-Fxleader-Steps': ' '.join(f'{status}={count}' for status, count in counts.items()),
+            'X-Fxleader-Changed': '1' if result.changed else '0',
+            'X-Fxleader-Time-Ms': f'{result.wall_ms:.2f}',
+        })
+
+
+class TransformServer(ThreadingHTTPServer):
+    """modify_html.transform over HTTP, on a pool of pre-warmed worker processes.
+
+    Requests are read on threads; each page goes to the pool, so pages
+    are transformed in parallel on up to `workers` cores instead of
+    taking turns on the GIL.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = DEFAULT_PORT, workers: int = 2, defaults: Optional[dict] = None,
+                 host: str = '127.0.0.1'):
+        super().__init__((host, port), TransformHandler)
+        self.workers = workers
+        self.defaults = defaults or {}
+        self.pool = None
+        self.start_pool()
+
+    def start_pool(self) -> None:
+        """Start every worker and wait until each has warmed up"""
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+        # The executor starts a new worker for each task submitted while
+        # none is idle, so one task per worker starts them all now.
+        for future in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def transform(self, html: str, config: dict):
+        try:
+            return self.pool.submit(transform, html, config).result()
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory): replace the pool once
+            self.pool.shutdown(wait=False)
+            self.start_pool()
+            return self.pool.submit(transform, html, config).result()
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def main(argv: Optional[list] = None) -> int:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Local HTTP transform service for the FISG HTML Modifier System')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--host', default='127.0.0.1', help="address to bind (default: 127.0.0.1)")
+    parser.add_argument('--workers', type=int, default=2, metavar='N',
+                        help="worker processes, started and warmed up before serving (0 = one per CPU)")
+    parser.add_argument('--config', default=os.path.join(script_dir, 'config.json'),
+                        help="config.json to take the default campaign settings from")
+    parser.add_argument('--campaign', metavar='NAME', help="campaign entry of config.json to use (default: the first)")
+    args = parser.parse_args(argv)
+
+    try:
+        defaults = load_defaults(args.config, args.campaign)
+    except (ValueError, OSError) as e:
+        print(f"✗ Could not load {args.config}: {e}")
+        return 1
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    started = time.perf_counter()
+    server = TransformServer(args.port, workers, defaults, args.host)
+    print(f"✓ {workers} worker(s) warmed up in {(time.perf_counter() - started) * 1000:.0f} ms")
+    print(f"✓ Serving on http://{args.host}:{server.server_address[1]}/transform")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
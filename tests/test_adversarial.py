@@ -0,0 +1,84 @@
+"""Linear-time guarantee of the modifier on the adversarial page shapes of benchmark.py
+
+A pattern that backtracks over the rest of the page at every start
+position makes the time per byte grow with the page: 8x the bytes would
+cost about 8x per KB. time_adversarial compares the best time per KB of
+a small and a large page of each shape; linear passes keep the ratio
+near 1, and MAX_GROWTH leaves room for timer noise on a busy machine.
+"""
+
+import re
+
+import pytest
+
+from benchmark import ADVERSARIAL_UNITS, generate_adversarial_page, time_adversarial
+from modify_html import GOOGLE_TAG_SNIPPET, transform
+
+SIZES = ('32KB', '256KB')
+MAX_GROWTH = 2.5
+REPEAT = 3
+
+
+@pytest.mark.parametrize('kind', sorted(ADVERSARIAL_UNITS))
+def test_time_per_byte_stays_flat(kind):
+    result = time_adversarial(kind, REPEAT, SIZES)
+    if result['growth'] > MAX_GROWTH:
+        # One retry, so a burst of load on the machine does not fail the run
+        result = time_adversarial(kind, REPEAT, SIZES)
+    assert result['growth'] <= MAX_GROWTH, (
+        f"{kind}: {result['small_ms_per_kb']:.3f} -> {result['large_ms_per_kb']:.3f} ms/KB "
+        f"(x{result['growth']:.2f}) from {SIZES[0]} to {SIZES[-1]}")
+
+
+# What every step reports on an adversarial page: there is no <style>, no
+# join form, no submit button and no dialog to work on, so only the Google
+# Tag goes in. ADVERSARIAL_OUTCOMES lists the steps that do find something.
+NOTHING_TO_EDIT = {
+    'add_google_tag': 'ok',
+    'add_cloudflare_dependencies': 'failed',
+    'convert_absolute_to_relative_paths': 'ok',
+    'ensure_join_form_id': 'warning',
+    'add_country_select_onchange': 'failed',
+    'add_cloudflare_turnstile_component': 'failed',
+    'ensure_submit_button_id': 'warning',
+    'add_hidden_input_fields': 'failed',
+    'clean_dialog_and_add_id': 'warning',
+    'replace_dialog_styles': 'failed',
+    'add_javascript_functionality': 'failed',
+}
+HIDDEN_INPUT = re.compile(r'\n\s*<input type="hidden"[^<>]*>')
+
+# kind -> (step statuses that differ from NOTHING_TO_EDIT, the <body> the input's <body> should become)
+ADVERSARIAL_OUTCOMES = {
+    # Only the first form gets the id and the hidden fields, the other forms are left alone
+    'forms_without_submit': ({'ensure_join_form_id': 'ok', 'add_hidden_input_fields': 'ok'}, None),
+    'unclosed_tags': ({}, lambda body: body),
+    'cards_without_close': ({}, lambda body: body),
+    'dialog_rules_without_style_end': ({}, lambda body: body),
+    'dialogs_without_html_end': ({}, lambda body: body),
+    'link_values_unclosed': ({}, lambda body: body),
+    # Every src is rewritten although none of the tags is closed
+    'host_urls_unclosed': ({}, lambda body: body.replace('https://www.fisg.com/', '/')),
+}
+
+
+def body(html):
+    return html[html.index('</head>'):]
+
+
+@pytest.mark.parametrize('kind', sorted(ADVERSARIAL_UNITS))
+def test_adversarial_page_outcome(kind):
+    page = generate_adversarial_page(kind, 16 * 1024)
+    result = transform(page, {'name': 'benchmark'})
+    changes, expected_body = ADVERSARIAL_OUTCOMES[kind]
+    assert {step.step: step.status for step in result.steps} == dict(NOTHING_TO_EDIT, **changes)
+    html = result.html
+    assert html.startswith('<html><head>') and GOOGLE_TAG_SNIPPET.strip() in html
+    if expected_body is not None:
+        assert body(html) == expected_body(body(page))
+    else:
+        assert html.count('id="joinForm"') == 1 and html.count('name="link_id"') == 1
+        first_form = body(html).index('<form id="joinForm" action="/join">')
+        restored = HIDDEN_INPUT.sub('', body(html)).replace(' id="joinForm"', '')
+        assert first_form == body(page).index('<form action="/join">')
+        assert restored == body(page)
@@ -0,0 +1,86 @@
+"""Build-time country options: prerender_country_options and restore_country_placeholders"""
+
+import os
+import json
+
+from modify_html import COUNTRY_OPTIONS_CLOSE, COUNTRY_OPTIONS_OPEN, COUNTRY_PLACEHOLDER, transform
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+def example_page(language):
+    with open(os.path.join(EXAMPLE, language, 'index.html'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def step(result, name):
+    return next(step for step in result.steps if step.step == name)
+
+
+def test_broken_options_block_is_a_warning_when_restoring():
+    rendered = transform(example_page('en'), {'name': 'fxleader', 'prerender_countries': True}).html
+    assert COUNTRY_OPTIONS_OPEN in rendered
+    broken = rendered.replace(COUNTRY_OPTIONS_CLOSE, '')
+    result = transform(broken, {'name': 'fxleader'})
+    restore = step(result, 'restore_country_placeholders')
+    assert restore.status == 'warning'
+    assert COUNTRY_OPTIONS_OPEN in result.html and COUNTRY_PLACEHOLDER not in result.html
+
+
+def test_restore_puts_the_placeholders_back():
+    rendered = transform(example_page('en'), {'name': 'fxleader', 'prerender_countries': True}).html
+    result = transform(rendered, {'name': 'fxleader'})
+    assert step(result, 'restore_country_placeholders').status == 'ok'
+    assert COUNTRY_OPTIONS_OPEN not in result.html
+    assert COUNTRY_PLACEHOLDER in result.html
+    assert 'value="{{language}}"' in result.html and 'value="{{phonecode}}"' in result.html
+
+
+def country_select(html):
+    start = html.index('<select name="country" id="country"')
+    return html[start:html.index('</select>', start)]
+
+
+def test_renders_the_options_into_the_country_select():
+    result = transform(example_page('en'), {'name': 'fxleader', 'prerender_countries': True})
+    select = country_select(result.html)
+    assert COUNTRY_PLACEHOLDER not in result.html
+    assert COUNTRY_OPTIONS_OPEN in select and COUNTRY_OPTIONS_CLOSE in select
+    # The page's own prompt stays the first option
+    assert select.index('<option value="">') < select.index(COUNTRY_OPTIONS_OPEN)
+    assert select.count('<option value=') == 1 + 198
+    assert '<option value="TH" code="66" lang="th">Thailand</option>' in select
+    assert 'id="language" value="en"' in result.html
+
+
+def test_language_without_every_name_is_left_to_the_edge_worker():
+    result = transform(example_page('th'), {'name': 'fxleader', 'prerender_countries': True})
+    prerender = step(result, 'prerender_country_options')
+    assert prerender.status == 'ok' and 'incomplete' in prerender.messages[0]
+    assert COUNTRY_PLACEHOLDER in country_select(result.html)
+    assert COUNTRY_OPTIONS_OPEN not in result.html
+    assert 'value="{{language}}"' in result.html
+
+
+def test_language_with_every_name_renders_in_data_order(tmp_path):
+    data = tmp_path / 'countries.json'
+    data.write_text(json.dumps({'countries': [
+        {'value': 'TH', 'code': '66', 'lang': 'th', 'name': {'en': 'Thailand', 'th': 'ไทย'}},
+        {'value': 'LA', 'code': '856', 'lang': 'lo', 'name': {'en': 'Laos', 'th': 'ลาว'}},
+        {'value': 'AU', 'code': '61', 'name': {'en': 'Australia', 'th': 'ออสเตรเลีย'}},
+    ]}), encoding='utf-8')
+    config = {'name': 'fxleader', 'prerender_countries': True, 'country_data': str(data)}
+    result = transform(example_page('th'), config)
+    options = country_select(result.html)
+    assert options.index('>ไทย<') < options.index('>ลาว<') < options.index('>ออสเตรเลีย<')
+    assert '<option value="AU" code="61">ออสเตรเลีย</option>' in options
+    assert 'id="language" value="th"' in result.html
+
+    # Names taken out of the data again: the rendered list goes back to the edge worker
+    data.write_text(json.dumps({'countries': [
+        {'value': 'TH', 'code': '66', 'lang': 'th', 'name': {'en': 'Thailand', 'th': 'ไทย'}},
+        {'value': 'AU', 'code': '61', 'name': {'en': 'Australia'}},
+    ]}), encoding='utf-8')
+    again = transform(result.html, config)
+    assert COUNTRY_OPTIONS_OPEN not in again.html
+    assert COUNTRY_PLACEHOLDER in country_select(again.html)
@@ -0,0 +1,107 @@
+"""inline_critical_css: the Bootstrap subset comes from vendor/, never from the network"""
+
+import os
+import base64
+import socket
+import hashlib
+import functools
+import urllib.request
+
+import pytest
+
+import critical_css
+import modify_html
+from modify_html import CRITICAL_ATTRIBUTE, STYLESHEET_INTEGRITY, transform
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(ROOT, 'example')
+BOOTSTRAP, ICONS = STYLESHEET_INTEGRITY
+
+# Stand-ins for the two cdnjs files: a rule the example page uses, one it does not
+STYLESHEETS = {
+    BOOTSTRAP: ('/*! Bootstrap v5.2.1 */:root{--bs-blue:#0d6efd}.fl-nav{display:flex}'
+                '.modal-backdrop{position:fixed}@media (min-width:768px){.fl-nav{gap:1rem}.offcanvas{width:0}}'),
+    ICONS: ('@font-face{font-family:"bootstrap-icons";src:url("./fonts/bootstrap-icons.woff2") format("woff2")}'
+            '.bi::before{font-family:bootstrap-icons!important}.bi-x::before{content:"\\f62a"}'),
+}
+
+
+def example_page(language):
+    with open(os.path.join(EXAMPLE, language, 'index.html'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def sha512(body):
+    return 'sha512-' + base64.b64encode(hashlib.sha512(body).digest()).decode('ascii')
+
+
+def step(result, name):
+    return next(step for step in result.steps if step.step == name)
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    """Any attempt to reach the network fails the test"""
+    def refuse(*args, **kwargs):
+        raise AssertionError('the critical CSS pass tried to use the network')
+
+    monkeypatch.setattr(socket.socket, 'connect', refuse)
+    monkeypatch.setattr(socket, 'create_connection', refuse)
+    monkeypatch.setattr(urllib.request, 'urlopen', refuse)
+    critical_css.load_stylesheet.cache_clear()
+    yield
+    critical_css.load_stylesheet.cache_clear()
+
+
+@pytest.fixture
+def vendor_dir(tmp_path, monkeypatch):
+    """A vendor/ holding the stand-ins, with STYLESHEET_INTEGRITY pointing at their hashes"""
+    for url, text in STYLESHEETS.items():
+        body = text.encode('utf-8')
+        (tmp_path / url.rsplit('/', 1)[-1]).write_bytes(body)
+        monkeypatch.setitem(STYLESHEET_INTEGRITY, url, sha512(body))
+    monkeypatch.setattr(modify_html, 'load_stylesheet',
+                        functools.partial(critical_css.load_stylesheet, vendor_dir=str(tmp_path)))
+    monkeypatch.setattr(modify_html, 'vendored_path',
+                        functools.partial(critical_css.vendored_path, vendor_dir=str(tmp_path)))
+    return tmp_path
+
+
+def test_inlines_the_used_rules_offline(vendor_dir):
+    result = transform(example_page('en'), {'name': 'fxleader', 'critical_css': True})
+    assert step(result, 'inline_critical_css').status == 'ok'
+    html = result.html
+    start = html.index(f'<style {CRITICAL_ATTRIBUTE}="bootstrap.min.css">')
+    subset = html[start:html.index('</style>', start)]
+    assert '/*! Bootstrap v5.2.1 */' in subset and ':root{--bs-blue:#0d6efd}' in subset
+    assert '.fl-nav{display:flex}' in subset and '.fl-nav{gap:1rem}' in subset
+    assert '.modal-backdrop' not in subset and '.offcanvas' not in subset
+    # The page has no bi-* icons: nothing of the icon font is inlined, the full file still loads lazily
+    assert f'{CRITICAL_ATTRIBUTE}="bootstrap-icons.min.css"' not in html
+    assert html.count(f'<link{modify_html.DEFERRED_CRITICAL} rel="stylesheet"') == 2
+    for url in STYLESHEETS:
+        assert html.count(f'href="{url}"') == 2  # the lazy <link> and its <noscript> fallback
+
+
+def test_missing_copy_fails_the_step_and_keeps_the_link(vendor_dir):
+    (vendor_dir / 'bootstrap.min.css').unlink()
+    result = transform(example_page('en'), {'name': 'fxleader', 'critical_css': True})
+    critical = step(result, 'inline_critical_css')
+    assert critical.status == 'failed'
+    assert 'No vendored copy of bootstrap.min.css' in critical.messages[0]
+    assert f'{CRITICAL_ATTRIBUTE}="bootstrap.min.css"' not in result.html
+
+
+def test_copy_that_does_not_match_its_integrity_is_refused(vendor_dir):
+    (vendor_dir / 'bootstrap.min.css').write_text('.fl-nav{display:none}', encoding='utf-8')
+    result = transform(example_page('en'), {'name': 'fxleader', 'critical_css': True})
+    critical = step(result, 'inline_critical_css')
+    assert critical.status == 'failed'
+    assert 'does not match the integrity hash' in critical.messages[0]
+    assert 'display:none' not in result.html
+
+
+@pytest.mark.skipif(not all(os.path.exists(critical_css.vendored_path(url)) for url in STYLESHEETS),
+                    reason='vendor/ has no copies of the cdnjs stylesheets (python3 critical_css.py --fetch)')
+def test_committed_copies_match_the_injected_links():
+    assert critical_css.vendor_problems(STYLESHEET_INTEGRITY) == []
@@ -0,0 +1,116 @@
+"""EditBuffer: edit ordering, overlapping and adjacent edits, and one write per page"""
+
+import pytest
+
+from benchmark import generate_page
+from modify_html import EditBuffer, HTMLModifier, StepLog
+
+SOURCE = '0123456789'
+
+
+def test_no_edits_is_the_source():
+    buffer = EditBuffer(SOURCE)
+    assert not buffer.pending
+    assert buffer.materialize() == SOURCE
+
+
+def test_insertions_at_one_offset_keep_their_order_before_a_replacement():
+    buffer = EditBuffer(SOURCE)
+    assert buffer.replace(2, 4, 'r')
+    assert buffer.insert(2, 'a')
+    assert buffer.insert(2, 'b')
+    assert buffer.materialize() == '01abr456789'
+
+
+def test_adjacent_replacements_both_apply():
+    buffer = EditBuffer(SOURCE)
+    assert buffer.replace(2, 4, 'x')
+    assert buffer.replace(4, 6, 'y')
+    assert buffer.insert(4, '|')
+    assert buffer.materialize() == '01x|y6789'
+
+
+def test_insertions_on_a_replacement_boundary_stay_outside_it():
+    buffer = EditBuffer(SOURCE)
+    assert buffer.insert(2, '[')
+    assert buffer.insert(6, ']')
+    assert buffer.replace(2, 6, 'mid')
+    assert buffer.materialize() == '01[mid]6789'
+
+
+def test_wider_replacement_supersedes_the_edits_inside_it():
+    buffer = EditBuffer(SOURCE)
+    assert buffer.insert(3, 'i')
+    assert buffer.replace(4, 5, 'r')
+    assert buffer.replace(2, 7, 'W')
+    assert buffer.materialize() == '01W789'
+    assert buffer.count == 3
+
+
+@pytest.mark.parametrize('start, end', [(3, 5), (1, 3), (5, 8), (2, 6)])
+def test_edit_inside_or_straddling_a_replacement_is_dropped(start, end):
+    buffer = EditBuffer(SOURCE)
+    assert buffer.replace(2, 6, 'R')
+    if (start, end) == (2, 6):
+        # The same range again supersedes the first replacement
+        assert buffer.replace(start, end, 'S')
+        assert buffer.materialize() == '01S6789'
+        return
+    assert not buffer.replace(start, end, 'x')
+    assert not buffer.insert(4, 'x')
+    assert buffer.materialize() == '01R6789'
+
+
+def test_current_shows_the_edits_inside_a_range():
+    buffer = EditBuffer('<form class="a">')
+    buffer.insert(5, ' id="joinForm"')
+    assert buffer.current(0, len(buffer.source)) == '<form id="joinForm" class="a">'
+    assert buffer.current(6, 15) == 'class="a"'
+
+
+def test_encoded_size_without_materializing():
+    buffer = EditBuffer('ไทย abc')
+    buffer.replace(4, 7, 'ภาษา')
+    buffer.insert(0, 'é')
+    assert buffer.encoded_size() == len(buffer.materialize().encode('utf-8'))
+
+
+@pytest.mark.parametrize('recorded', [
+    [],
+    [('insert', 0, '<'), ('insert', 5, '|'), ('insert', 10, '>'), ('replace', 7, 9, 'R')],
+    # Each of these collides with one of the sorted edits below, so replace_sorted falls back
+    [('replace', 4, 6, 'R')],
+    [('replace', 0, 3, 'R')],
+    [('insert', 6, 'inside')],
+])
+def test_replace_sorted_matches_replace_one_at_a_time(recorded):
+    edits = [(1, 2, 'a'), (4, 5, 'bb'), (5, 7, ''), (9, 10, 'c')]
+    one_by_one, sorted_at_once = EditBuffer(SOURCE), EditBuffer(SOURCE)
+    for buffer in (one_by_one, sorted_at_once):
+        for kind, *args in recorded:
+            getattr(buffer, kind)(*args)
+    for edit in edits:
+        one_by_one.replace(*edit)
+    sorted_at_once.replace_sorted(edits)
+    assert sorted_at_once.materialize() == one_by_one.materialize()
+    assert sorted_at_once.count == one_by_one.count
+    # Later edits see the same recorded replacements
+    assert sorted_at_once.insert(6, '!') == one_by_one.insert(6, '!')
+    assert sorted_at_once.materialize() == one_by_one.materialize()
+
+
+def test_the_eleven_steps_write_the_page_once(monkeypatch):
+    materialized = []
+    original = EditBuffer.materialize
+
+    def counting(buffer):
+        materialized.append(buffer.count)
+        return original(buffer)
+
+    monkeypatch.setattr(EditBuffer, 'materialize', counting)
+    modifier = HTMLModifier(generate_page(64 * 1024), working_dir='test', config_name='test')
+    modifier.log = StepLog()
+    modifier.apply_all_modifications()
+    assert [result.status for result in modifier.log.results] == ['ok'] * 11
+    # Every step's edits, step 3's URL rewrites included, go into the one write
+    assert len(materialized) == 1 and materialized[0] > 100
@@ -0,0 +1,106 @@
+"""optimize_image_tags and restore_image_tags: loading hints, the hero image and dimensions"""
+
+import os
+import re
+import struct
+
+from modify_html import IMAGE_ATTRIBUTE, IMAGE_SIZE_STYLE, transform
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+STAMP = re.compile(r'\n?[ \t]*<!-- fxleader-modifier [^<>]*-->')
+
+PAGE = '''<html><head><title>t</title><style>body { margin: 0; }</style></head><body>
+<nav><img src="/nav-logo.png"></nav>
+<header><img src="/header-logo.png" alt=""></header>
+<main>
+<section><img src="/hero.png" alt="hero"><img src="/side.png"></section>
+<section><img src="/below.png" loading="eager"><img src="/photo.png" decoding="sync"></section>
+</main>
+</body></html>'''
+
+
+def example_page(language):
+    with open(os.path.join(EXAMPLE, language, 'index.html'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def unstamped(html):
+    return STAMP.sub('', html)
+
+
+def img(html, src):
+    return re.search(r'<img[^<>]*src="' + re.escape(src) + r'"[^<>]*>', html).group()
+
+
+def step(result, name):
+    return next(step for step in result.steps if step.step == name)
+
+
+def write_png(path, width, height):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + struct.pack('>I4sII', 13, b'IHDR', width, height) + b'\x08\x06\x00\x00\x00')
+
+
+def test_hero_is_the_first_main_content_image():
+    html = transform(PAGE, {'name': 'fxleader', 'optimize_images': True}).html
+    assert img(html, '/hero.png') == (f'<img src="/hero.png" alt="hero" fetchpriority="high" '
+                                      f'{IMAGE_ATTRIBUTE}="fetchpriority">')
+    for logo in ('/nav-logo.png', '/header-logo.png'):
+        assert 'fetchpriority' not in img(html, logo) and 'loading' not in img(html, logo)
+    assert img(html, '/side.png').endswith(f' loading="lazy" decoding="async" {IMAGE_ATTRIBUTE}="loading decoding">')
+    # What the page set stays, only the missing half is added
+    assert img(html, '/below.png') == f'<img src="/below.png" loading="eager" decoding="async" {IMAGE_ATTRIBUTE}="decoding">'
+    assert img(html, '/photo.png') == f'<img src="/photo.png" decoding="sync" loading="lazy" {IMAGE_ATTRIBUTE}="loading">'
+
+
+def test_example_page_hero_is_not_the_header_logo():
+    result = transform(example_page('en'), {'name': 'fxleader', 'optimize_images': True})
+    assert step(result, 'optimize_image_tags').messages[-1] == 'Hero image fisg-ct-regulation-img.png: fetchpriority=high'
+    assert 'fetchpriority' not in img(result.html, '/wp-content/uploads/2025/08/fisg-fl-header-logo.png')
+
+
+def test_largest_known_image_above_the_fold_is_the_hero(tmp_path):
+    # No <header> or <main>: the fold ends the first <section>, and the content is what is outside <nav>
+    page = ('<html><head></head><body>\n<nav><img src="/nav-logo.png"></nav>\n'
+            '<section><img src="/small.png"><img src="/big.png"></section>\n'
+            '<section><img src="/later.png"></section>\n</body></html>')
+    sizes = {'nav-logo.png': (2000, 200), 'small.png': (100, 100), 'big.png': (1200, 600), 'later.png': (1600, 900)}
+    for name, (width, height) in sizes.items():
+        write_png(str(tmp_path / name), width, height)
+    html = transform(page, {'name': 'fxleader', 'optimize_images': True, 'image_mirror': str(tmp_path)}).html
+    assert 'fetchpriority="high"' in img(html, '/big.png')
+    assert 'fetchpriority' not in img(html, '/nav-logo.png') + img(html, '/small.png') + img(html, '/later.png')
+    assert 'loading="lazy"' in img(html, '/later.png')
+
+
+def test_dimensions_from_the_mirror_and_restore(tmp_path):
+    write_png(str(tmp_path / 'hero.png'), 800, 400)
+    config = {'name': 'fxleader', 'optimize_images': True, 'image_mirror': str(tmp_path)}
+    result = transform(PAGE, config)
+    html = result.html
+    assert img(html, '/hero.png') == (f'<img src="/hero.png" alt="hero" width="800" height="400" '
+                                      f'fetchpriority="high" {IMAGE_ATTRIBUTE}="width height fetchpriority">')
+    assert html.count(IMAGE_SIZE_STYLE) == 1
+    assert step(result, 'optimize_image_tags').status == 'warning'  # the other images are not in the mirror
+
+    # Without the mirror, the dimensions and the style go again
+    html = transform(unstamped(html), {'name': 'fxleader', 'optimize_images': True}).html
+    assert img(html, '/hero.png') == f'<img src="/hero.png" alt="hero" fetchpriority="high" {IMAGE_ATTRIBUTE}="fetchpriority">'
+    assert IMAGE_SIZE_STYLE not in html
+
+
+def test_second_pass_changes_nothing():
+    config = {'name': 'fxleader', 'optimize_images': True}
+    once = unstamped(transform(example_page('en'), config).html)
+    assert unstamped(transform(once, config).html) == once
+
+
+def test_turning_the_option_off_restores_the_page(tmp_path):
+    write_png(str(tmp_path / 'hero.png'), 800, 400)
+    plain = unstamped(transform(PAGE, {'name': 'fxleader'}).html)
+    optimized = transform(PAGE, {'name': 'fxleader', 'optimize_images': True, 'image_mirror': str(tmp_path)}).html
+    restored = transform(optimized, {'name': 'fxleader'})
+    assert step(restored, 'restore_image_tags').messages == ['Image pass removed, 4 images back as the page wrote them']
+    assert unstamped(restored.html) == plain
+    assert unstamped(transform(restored.html, {'name': 'fxleader'}).html) == plain
@@ -0,0 +1,123 @@
+"""KVClient against the local stand-in KV API: retries, keep-alive connections and bulk writes"""
+
+import threading
+
+import pytest
+
+from kv_upload import KVClient, KVSettings, StandInKVServer, bulk_batches
+
+TOKEN = 'test-token'
+
+
+class CountingKVServer(StandInKVServer):
+    """A stand-in that also counts the TCP connections it accepted"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+@pytest.fixture
+def kv_server():
+    servers = []
+
+    def start(fail_first=0):
+        server = CountingKVServer(0, TOKEN, fail_first)
+        threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def client_for(server, **options):
+    settings = KVSettings('account', 'namespace', TOKEN, server.api_base)
+    options.setdefault('backoff', 0.001)
+    return KVClient(settings, **options)
+
+
+def pages(count):
+    return [(f'fxleader:{i}', f'<html>page {i} ไทย</html>') for i in range(count)]
+
+
+def test_put_value_retries_throttled_requests(kv_server):
+    server = kv_server(fail_first=3)
+    with client_for(server, concurrency=1) as client:
+        result = client.put_value('fxleader', '<html>en</html>')
+    assert result.ok and result.attempts == 4
+    assert result.size == len('<html>en</html>')
+    assert server.store == {'fxleader': '<html>en</html>'}
+    assert server.requests == 4
+
+
+def test_gives_up_after_the_retries(kv_server):
+    server = kv_server(fail_first=10)
+    with client_for(server, concurrency=1, retries=2) as client:
+        result = client.put_value('fxleader', '<html>en</html>')
+    assert not result.ok and result.attempts == 3
+    assert '429' in result.error and 'rate limited' in result.error
+    assert server.store == {}
+
+
+def test_uploads_reuse_one_connection_per_worker(kv_server):
+    server = kv_server(fail_first=2)
+    with client_for(server, concurrency=2) as client:
+        results = client.upload(pages(20))
+        assert len(client._connections) <= 2
+    assert [result.key for result in results] == [key for key, _ in pages(20)]
+    assert all(result.ok for result in results)
+    assert server.store == dict(pages(20))
+    # 20 keys plus the 2 throttled attempts, over at most one connection per worker
+    assert server.requests == 22
+    assert server.connections <= 2
+
+
+def test_bulk_upload_retries_and_writes_every_key(kv_server):
+    server = kv_server(fail_first=1)
+    with client_for(server, concurrency=1) as client:
+        results = client.upload(pages(5), bulk=True)
+    assert all(result.ok and result.attempts == 2 for result in results)
+    assert server.store == dict(pages(5))
+    assert server.requests == 2
+
+
+def test_bulk_batches_respect_the_key_limit(kv_server):
+    server = kv_server()
+    batches = bulk_batches(pages(7), max_keys=3)
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    with client_for(server, concurrency=2) as client:
+        results = []
+        for batch in batches:
+            results.extend(client.put_bulk(batch))
+    assert [result.key for result in results] == [key for key, _ in pages(7)]
+    assert server.store == dict(pages(7))
+    assert server.requests == 3
+    assert server.connections == 1
+
+
+def test_bad_token_is_not_retried(kv_server):
+    server = kv_server()
+    settings = KVSettings('account', 'namespace', 'wrong-token', server.api_base)
+    with KVClient(settings, concurrency=1, backoff=0.001) as client:
+        result = client.put_value('fxleader', '<html>en</html>')
+    assert not result.ok and result.attempts == 1
+    assert 'bad token' in result.error
+
+
+def test_repeated_uploads_share_the_client_pool(kv_server):
+    server = kv_server()
+    with client_for(server, concurrency=2) as client:
+        for _ in range(5):
+            assert all(result.ok for result in client.upload(pages(4)))
+        assert len(client._connections) <= 2
+    assert client._connections == [] and client._pool is None
+    assert server.requests == 20
+    assert server.connections <= 2
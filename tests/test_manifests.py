@@ -0,0 +1,183 @@
+"""Build and publish manifests: an unchanged page is skipped, and what makes it count again"""
+
+import functools
+import io
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+import modify_html
+from kv_upload import PUBLISH_MANIFEST_FILENAME, KVClient, StandInKVServer
+from modify_html import MANIFEST_FILENAME, BuildManifest, RunLog, process_language_file, upload_campaigns
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+TOKEN = 'test-token'
+
+
+@pytest.fixture
+def example_dir(tmp_path):
+    for lang in ('en', 'th'):
+        os.makedirs(tmp_path / lang)
+        shutil.copy(os.path.join(EXAMPLE, lang, 'index.html'), tmp_path / lang / 'index.html')
+    return str(tmp_path)
+
+
+def page_path(example_dir, lang='en'):
+    return os.path.join(example_dir, lang, 'index.html')
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def build(example_dir, lang='en', modifier_options=None):
+    """One run of a language page with its manifest, as main() does it; returns the page notes"""
+    log = RunLog(stream=io.StringIO()).collecting()
+    manifest = BuildManifest.load(example_dir, None, 'fxleader', modifier_options)
+    assert process_language_file(lang, example_dir, None, 'fxleader', manifest=manifest,
+                                 modifier_options=modifier_options, log=log)
+    manifest.save()
+    [page] = log.pages
+    return [message for _, message in page.notes]
+
+
+def skipped(notes):
+    return any(message.startswith('Up to date, skipped') for message in notes)
+
+
+def test_second_build_is_skipped(example_dir):
+    assert not skipped(build(example_dir))
+    processed = read(page_path(example_dir))
+    mtime = os.stat(page_path(example_dir)).st_mtime_ns
+    assert skipped(build(example_dir))
+    assert read(page_path(example_dir)) == processed
+    assert os.stat(page_path(example_dir)).st_mtime_ns == mtime
+    # Other languages have their own entry
+    assert not skipped(build(example_dir, 'th'))
+
+
+def test_build_manifest_is_saved_as_json(example_dir):
+    build(example_dir)
+    with open(os.path.join(example_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        entries = json.load(f)['entries']
+    assert set(entries) == {'en'}
+    assert set(entries['en']) == {'input', 'output', 'modifier', 'config'}
+    assert entries['en']['output'] == modify_html.content_hash(read(page_path(example_dir)))
+    assert not [name for name in os.listdir(example_dir) if name.startswith(MANIFEST_FILENAME + '.')]
+
+
+def test_edited_page_is_processed_again(example_dir):
+    build(example_dir)
+    with open(page_path(example_dir), 'a', encoding='utf-8') as f:
+        f.write('\n<!-- edited by hand -->\n')
+    assert not skipped(build(example_dir))
+    assert skipped(build(example_dir))
+
+
+def test_page_restored_from_its_source_is_processed_again(example_dir):
+    source = read(page_path(example_dir))
+    build(example_dir)
+    with open(page_path(example_dir), 'w', encoding='utf-8') as f:
+        f.write(source)
+    notes = build(example_dir)
+    assert not skipped(notes)
+    assert read(page_path(example_dir)) != source
+
+
+def test_other_options_are_not_current(example_dir):
+    build(example_dir)
+    assert not skipped(build(example_dir, modifier_options={'minify': True}))
+    assert skipped(build(example_dir, modifier_options={'minify': True}))
+    assert not skipped(build(example_dir))
+
+
+def test_new_modifier_version_is_not_current(example_dir, monkeypatch):
+    build(example_dir)
+    monkeypatch.setattr(modify_html, 'modifier_version', lambda: 'next')
+    assert not skipped(build(example_dir))
+
+
+@pytest.mark.parametrize('content', ['', 'not json', '[]'])
+def test_unreadable_manifest_starts_empty(example_dir, content):
+    with open(os.path.join(example_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        f.write(content)
+    assert BuildManifest.load(example_dir, None, 'fxleader').entries == {}
+    assert not skipped(build(example_dir))
+
+
+@pytest.fixture
+def kv_server(monkeypatch):
+    for env in ('CLOUDFLARE_API_TOKEN', 'CLOUDFLARE_ACCOUNT_ID', 'CLOUDFLARE_KV_NAMESPACE_ID'):
+        monkeypatch.delenv(env, raising=False)
+    servers = []
+
+    def start(fail_first=0):
+        server = StandInKVServer(0, TOKEN, fail_first)
+        threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def publish(example_dir, server, namespace='namespace', force=False):
+    campaign = {
+        'name': 'fxleader',
+        'languages': ['en', 'th'],
+        'example_dir': example_dir,
+        'kv': {'account_id': 'account', 'namespace_id': namespace, 'api_token': TOKEN,
+               'api_base': server.api_base},
+    }
+    uploaded, skipped_keys = upload_campaigns([campaign], [True, True], concurrency=1, force=force,
+                                              log=RunLog(stream=io.StringIO()))
+    return [result.key for result in uploaded if result.ok], [key for key, _ in skipped_keys]
+
+
+def test_second_upload_is_skipped(example_dir, kv_server):
+    server = kv_server()
+    assert publish(example_dir, server) == (['fxleader', 'fxleader:th'], [])
+    requests = server.requests
+    assert publish(example_dir, server) == ([], ['fxleader', 'fxleader:th'])
+    assert server.requests == requests
+    assert server.store['fxleader'] == read(page_path(example_dir))
+
+
+def test_changed_page_is_uploaded_again(example_dir, kv_server):
+    server = kv_server()
+    publish(example_dir, server)
+    with open(page_path(example_dir, 'th'), 'a', encoding='utf-8') as f:
+        f.write('<!-- rebuilt -->')
+    assert publish(example_dir, server) == (['fxleader:th'], ['fxleader'])
+    assert server.store['fxleader:th'] == read(page_path(example_dir, 'th'))
+
+
+def test_other_namespace_is_not_current(example_dir, kv_server):
+    server = kv_server()
+    publish(example_dir, server)
+    assert publish(example_dir, server, namespace='staging') == (['fxleader', 'fxleader:th'], [])
+    with open(os.path.join(example_dir, PUBLISH_MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        namespaces = json.load(f)['namespaces']
+    assert sorted(name.rsplit('/', 1)[1] for name in namespaces) == ['namespace', 'staging']
+
+
+def test_force_uploads_current_pages(example_dir, kv_server):
+    server = kv_server()
+    publish(example_dir, server)
+    assert publish(example_dir, server, force=True) == (['fxleader', 'fxleader:th'], [])
+
+
+def test_failed_uploads_are_not_recorded(example_dir, kv_server, monkeypatch):
+    # More throttled answers than the client retries, so every key fails
+    monkeypatch.setattr(modify_html, 'KVClient', functools.partial(KVClient, backoff=0.001))
+    failing = kv_server(fail_first=100)
+    assert publish(example_dir, failing) == ([], [])
+    assert not os.path.exists(os.path.join(example_dir, PUBLISH_MANIFEST_FILENAME))
+    server = kv_server()
+    assert publish(example_dir, server) == (['fxleader', 'fxleader:th'], [])
@@ -0,0 +1,86 @@
+"""minify.py: what the conservative minifier removes and what it must keep as is"""
+
+import os
+import re
+
+import pytest
+
+from minify import PLACEHOLDER, minify_css, minify_html, minify_js
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+def example_page(language):
+    with open(os.path.join(EXAMPLE, language, 'index.html'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_whitespace_in_text_and_tags_collapses():
+    html = '<div   class="a"\n   id="b"  >  text   more  </div>\n\n\n<p>x</p>'
+    assert minify_html(html) == '<div class="a" id="b"> text more </div>\n<p>x</p>'
+
+
+def test_attribute_values_are_kept():
+    html = '<input value="  spaced  value  " placeholder=\'a  b\'>'
+    assert minify_html(html) == html
+
+
+@pytest.mark.parametrize('placeholder', ['{{select:country}}', '{{  select:country }}', '{{a   b}}'])
+def test_placeholders_are_kept(placeholder):
+    html = f'<select id="country">   {placeholder}   </select><input value="{placeholder}">'
+    assert placeholder in minify_html(html)
+    assert placeholder in minify_css(f'.a{{content:"x"}}  {placeholder}  .b{{}}')
+    assert placeholder in minify_js(f'var  a  =  "{placeholder}";\n  {placeholder}')
+
+
+@pytest.mark.parametrize('html', [
+    '<pre>  keep\n   this  </pre>',
+    '<textarea>  a\n\n  b </textarea>',
+    '<PRE class="x">  a  </PRE>',
+    '<script type="text/template">  <p>  {{x}}  </p>  </script>',
+])
+def test_raw_elements_are_copied_as_is(html):
+    assert minify_html(f'<p>  a  </p>{html}<p>  b  </p>') == f'<p> a </p>{html}<p> b </p>'
+
+
+def test_only_guarded_comments_survive():
+    html = '<!-- drop --><!--! keep --><!--[if IE]><p>ie</p><![endif]--><p>x</p><!---->'
+    assert minify_html(html) == '<!--! keep --><!--[if IE]><p>ie</p><![endif]--><p>x</p>'
+    assert minify_css('/* drop */ .a { color: red; } /*! license */') == '.a{color:red}/*! license */'
+    assert minify_js('/* drop */ var a = 1; // drop\n/*! license */') == 'var a=1;\n/*! license */'
+
+
+def test_country_options_guard_survives():
+    html = '<select>\n  <!--!fxleader-countries-->\n  <option>a</option>\n  <!--!/fxleader-countries-->\n</select>'
+    assert minify_html(html) == '<select>\n<!--!fxleader-countries-->\n<option>a</option>\n<!--!/fxleader-countries-->\n</select>'
+
+
+@pytest.mark.parametrize('code, expected', [
+    # A newline that may end a statement stays
+    ('var a = 1\nvar b = 2', 'var a=1\nvar b=2'),
+    ('let x = y\n(z)', 'let x=y\n(z)'),
+    ('let a = b\n++c', 'let a=b\n++c'),
+    ('if (a) {\n  return\n  b\n}', 'if(a){return\nb}'),
+    # One after { ; , or before } never does
+    ('function f() {\n  a();\n  b();\n}', 'function f(){a();b();}'),
+    ('var o = {\n  a: 1,\n  b: 2\n}', 'var o={a:1,b:2}'),
+])
+def test_asi_newlines_are_kept(code, expected):
+    assert minify_js(code) == expected
+
+
+def test_strings_regexes_and_templates_are_kept():
+    code = 'var s = "a  //  b"; var r = /  x  /g; var t = `  ${ a  +  b }  `'
+    minified = minify_js(code)
+    for literal in ('"a  //  b"', '/  x  /g', '`  ${ a  +  b }  `'):
+        assert literal in minified
+    assert minify_css('.a { content: "  {  }  " }') == '.a{content:"  {  }  "}'
+
+
+def test_example_page_keeps_every_placeholder_and_is_stable():
+    page = example_page('en')
+    minified = minify_html(page)
+    assert len(minified) < len(page)
+    assert PLACEHOLDER.findall(minified) == PLACEHOLDER.findall(page)
+    assert re.findall(r'<!--!.*?-->', minified) == re.findall(r'<!--!.*?-->', page)
+    assert minify_html(minified) == minified
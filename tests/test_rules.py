@@ -0,0 +1,28 @@
+"""RULES.scan and MarkerScanner: which idempotency markers a page already has"""
+
+import os
+
+from modify_html import RULES, MarkerScanner
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+def test_finds_every_marker_present():
+    scanner = MarkerScanner({'tag': 'G-XEYRPJNWLJ', 'form': 'id="joinForm"', 'button': 'id="submitBtn"'})
+    assert scanner.scan('<form id="joinForm"><script>G-XEYRPJNWLJ</script>') == {'tag', 'form'}
+    assert scanner.scan('<p>nothing here</p>') == frozenset()
+
+
+def test_contained_and_overlapping_markers():
+    scanner = MarkerScanner({'long': 'closeDialog()', 'short': 'Dialog', 'tail': 'g()x', 'empty': ''})
+    assert scanner.scan('onclick="closeDialog()"') == {'long', 'short'}
+    assert scanner.scan('closeDialog()x') == {'long', 'short', 'tail'}
+    assert scanner.scan('openDialog') == {'short'}
+
+
+def test_registry_scan_matches_per_marker_checks():
+    with open(os.path.join(EXAMPLE, 'en', 'index.html'), 'r', encoding='utf-8') as f:
+        page = f.read()
+    expected = {name for name, literal in RULES.markers.items() if literal in page}
+    assert RULES.scan(page) == expected
+    assert RULES.scan('') == frozenset()
@@ -0,0 +1,55 @@
+"""RunLog.render_page: the text block modify_html.py prints for each page"""
+
+from runlog import RunLog, StepLog
+
+
+def page_log(*entries):
+    """A language page's StepLog: ('step', [(status, message), ...]) or (status, message) entries"""
+    page = StepLog(language='en')
+    for entry in entries:
+        if isinstance(entry[1], list):
+            with page.capture(entry[0]):
+                for status, message in entry[1]:
+                    page.add(status, message)
+        else:
+            page.add(*entry)
+    return page
+
+
+def test_processed_page_has_the_header_once():
+    page = page_log(('add_google_tag', [('ok', 'Google Tag added')]),
+                    ('ensure_join_form_id', [('ok', "Form id='joinForm' added/verified")]),
+                    ('ok', 'All modifications applied'),
+                    ('ok', 'Successfully saved: en/index.html'),
+                    ('validate', [('ok', 'All 9 fxleader.md checks passed')]))
+    text = RunLog().render_page(page)
+    assert text.count('Applying modifications...') == 1
+    assert text.index('Applying modifications...') < text.index('Google Tag added')
+    assert text.index('Successfully saved') < text.index('All 9 fxleader.md checks passed')
+
+
+def test_skipped_page_has_no_header():
+    page = page_log(('ok', 'Up to date, skipped: en/index.html'),
+                    ('validate', [('ok', 'All 9 fxleader.md checks passed')]))
+    text = RunLog().render_page(page)
+    assert 'Applying modifications...' not in text
+    lines = text.splitlines()
+    skipped = lines.index('✓ Up to date, skipped: en/index.html')
+    assert lines[skipped + 1:skipped + 3] == ['', '  ✓ All 9 fxleader.md checks passed']
+
+
+def test_stamp_current_page_has_no_header():
+    page = page_log(('ok', 'Page stamp is current, all modifications already applied'),
+                    ('ok', 'Unchanged, not rewritten: en/index.html'),
+                    ('validate', [('ok', 'All 9 fxleader.md checks passed')]))
+    assert 'Applying modifications...' not in RunLog().render_page(page)
+
+
+def test_quiet_level_keeps_only_warnings_and_failures():
+    page = page_log(('add_google_tag', [('ok', 'Google Tag added')]),
+                    ('ensure_submit_button_id', [('warning', 'Submit button not found')]),
+                    ('ok', 'All modifications applied'))
+    text = RunLog('warning').render_page(page)
+    assert '⚠ Submit button not found' in text
+    assert 'Google Tag added' not in text and 'All modifications applied' not in text
+    assert 'Applying modifications...' not in text
@@ -0,0 +1,80 @@
+"""UrlRewriter: which host URLs step 3 makes root-relative, and how they are counted"""
+
+import pytest
+
+from modify_html import UrlRewriter, transform
+
+
+@pytest.mark.parametrize('html, expected, stats', [
+    # Mapped attribute on a tag the attribute map lists for it, any quote and scheme
+    ('<a href="https://www.fisg.com/join">', '<a href="/join">', {'href': 1}),
+    ("<link rel=\"icon\" href='http://www.fisg.com/f.ico'>", "<link rel=\"icon\" href='/f.ico'>", {'href': 1}),
+    ('<meta property="og:image" content="https://www.fisg.com/og.png">',
+     '<meta property="og:image" content="/og.png">', {'content': 1}),
+    ('<script src="//www.fisg.com/a.js"></script>', '<script src="/a.js"></script>', {'src': 1}),
+    ('<img title="a > b" src="https://www.fisg.com/a.png">', '<img title="a > b" src="/a.png">', {'src': 1}),
+    ('<img srcset="https://www.fisg.com/a.png 1x, https://www.fisg.com/b.png 2x">',
+     '<img srcset="/a.png 1x, /b.png 2x">', {'srcset': 2}),
+    # Tag or attribute the map does not list for it
+    ('<div href="https://www.fisg.com/x">', '<div href="https://www.fisg.com/x">', {}),
+    ('<meta data-content="https://www.fisg.com/og.png">', '<meta data-content="https://www.fisg.com/og.png">', {}),
+    ('<div srcset="https://www.fisg.com/a.png 1x">', '<div srcset="https://www.fisg.com/a.png 1x">', {}),
+    # Other hosts, including one the configured host is a prefix of
+    ('<a href="https://fisg.com/x">', '<a href="https://fisg.com/x">', {}),
+    ('<a href="https://www.fisg.com.example.org/x">', '<a href="https://www.fisg.com.example.org/x">', {}),
+])
+def test_host_and_attribute_mapping(html, expected, stats):
+    rewriter = UrlRewriter()
+    assert rewriter.rewrite(html) == expected
+    assert rewriter.stats == stats
+
+
+@pytest.mark.parametrize('html, expected', [
+    ('<div style="background:url(https://www.fisg.com/bg.png)">', '<div style="background:url(/bg.png)">'),
+    ("<style>.a{background:url('https://www.fisg.com/bg.png')}</style>", "<style>.a{background:url('/bg.png')}</style>"),
+    ('<style>.a{background:url("//www.fisg.com/bg.png")}</style>', '<style>.a{background:url("/bg.png")}</style>'),
+])
+def test_css_urls_count_as_style(html, expected):
+    rewriter = UrlRewriter()
+    assert rewriter.rewrite(html) == expected
+    assert rewriter.stats == {'style': 1}
+
+
+def test_doubled_slash_after_the_host_collapses():
+    rewriter = UrlRewriter()
+    html = ('<img src="https://www.fisg.com//wp/a.png">'
+            '<p>see https://www.fisg.com//about and https://www.fisg.com/ok</p>'
+            "<style>.a{background:url('https://www.fisg.com///bg.png')}</style>")
+    assert rewriter.rewrite(html) == ('<img src="/wp/a.png">'
+                                      '<p>see https://www.fisg.com/about and https://www.fisg.com/ok</p>'
+                                      "<style>.a{background:url('/bg.png')}</style>")
+    # Text URLs keep their host, only the slash is fixed
+    assert rewriter.stats == {'src': 1, 'style': 1}
+    assert rewriter.double_slash == 3
+
+
+def test_configured_hosts_and_attributes():
+    rewriter = UrlRewriter(['www.fisg.com', 'cdn.fisg.com'], {'href': ('a',), 'data-src': None})
+    html = ('<a href="https://cdn.fisg.com/x"><img src="https://www.fisg.com/y" data-src="https://cdn.fisg.com/z">'
+            '<link href="https://www.fisg.com/l">')
+    assert rewriter.rewrite(html) == ('<a href="/x"><img src="https://www.fisg.com/y" data-src="/z">'
+                                      '<link href="https://www.fisg.com/l">')
+    assert rewriter.stats == {'href': 1, 'data-src': 1}
+
+
+def test_iter_edits_are_minimal_and_in_order():
+    html = '<a href="https://www.fisg.com/a"><img src="//www.fisg.com//b">'
+    edits = list(UrlRewriter().iter_edits(html))
+    assert [html[start:end] for start, end, _ in edits] == ['https://www.fisg.com/', '//www.fisg.com//']
+    assert all(replacement == '/' for _, _, replacement in edits)
+    assert [start for start, _, _ in edits] == sorted(start for start, _, _ in edits)
+
+
+def test_step_3_reports_per_attribute():
+    page = ('<html><head><style>body{}</style></head><body>'
+            '<a href="https://www.fisg.com/a"><img src="https://www.fisg.com//b.png"></body></html>')
+    result = transform(page, {'name': 'fxleader', 'url_hosts': ['www.fisg.com']})
+    step = next(step for step in result.steps if step.step == 'convert_absolute_to_relative_paths')
+    assert step.messages == ['Converted 2 absolute paths to relative paths (1 href, 1 src)',
+                             'Fixed 1 double slash URLs']
+    assert '<a href="/a"><img src="/b.png">' in result.html
@@ -0,0 +1,102 @@
+"""PageValidator: the fxleader.md checks on processed pages, passing and failing"""
+
+import os
+
+import pytest
+
+from benchmark import generate_page
+from modify_html import GOOGLE_TAG_SNIPPET, PageValidator, StepLog, transform
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+LANGUAGES = ('en', 'lo', 'ms', 'th', 'vi')
+
+
+def example_page(language):
+    with open(os.path.join(EXAMPLE, language, 'index.html'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture(scope='module')
+def processed():
+    return transform(generate_page(32 * 1024), {'name': 'fxleader'}).html
+
+
+def edited(html, old, new, count=1):
+    assert html.count(old) >= count
+    return html.replace(old, new, count)
+
+
+@pytest.mark.parametrize('language', LANGUAGES)
+def test_processed_example_pages_pass(language):
+    html = transform(example_page(language), {'name': 'fxleader'}).html
+    assert PageValidator('fxleader').validate(html) == []
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'minify': True},
+    {'assets': 'external'},
+    {'optimize_head': True, 'lazy_crypto': True},
+    {'optimize_images': True, 'prerender_countries': True},
+])
+def test_pages_pass_with_every_option(options):
+    html = transform(generate_page(32 * 1024), dict(options, name='fxleader')).html
+    assert PageValidator('fxleader').validate(html) == []
+
+
+def test_unprocessed_page_fails_the_page_wide_checks():
+    failures = PageValidator('fxleader').validate(example_page('en'))
+    assert [check for check, _ in failures] == ['google_tag', 'turnstile_dependencies', 'relative_urls',
+                                                'join_form', 'dialog_content']
+    assert failures[1][1] == 'Missing bootstrap.min.css, bootstrap-icons.min.css, api.js'
+
+
+@pytest.mark.parametrize('old, new, check, message', [
+    ('</head>', GOOGLE_TAG_SNIPPET + '</head>', 'google_tag', 'Google tag script found 2 times, expected once'),
+    ('<script src="https://challenges.cloudflare.com/turnstile/v0/api.js" defer></script>', '',
+     'turnstile_dependencies', 'Missing api.js'),
+    ('rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.2.1/css/bootstrap.min.css"',
+     'rel="preload" as="style" href="https://cdnjs.cloudflare.com/ajax/libs/bootstrap/5.2.1/css/bootstrap.min.css"',
+     'turnstile_dependencies', 'Missing bootstrap.min.css'),
+    ('</form>', '<img src="https://www.fisg.com/late.png"></form>', 'relative_urls',
+     '1 absolute URLs on www.fisg.com left'),
+    (' onchange="countryChange()"', '', 'country_change', 'Country select has no onchange="countryChange()"'),
+    ('<select name="country"', '<select name="nation"', 'country_change', 'No country select inside joinForm'),
+    ('<div class="cf-turnstile"', '<div class="turnstile"', 'turnstile_component',
+     'No cf-turnstile div inside joinForm'),
+    ('<button id="submitBtn" type="submit">', '<button id="submitBtn" type="button">', 'submit_button',
+     'No submit button id="submitBtn" inside joinForm'),
+    ('<input type="hidden" value="{{addr}}" name="addr">', '', 'hidden_inputs', 'Missing hidden inputs: addr'),
+    ('value="fxleader" name="link_id"', 'value="other" name="link_id"', 'hidden_inputs',
+     "link_id is 'other', expected 'fxleader'"),
+    ('value="{{source}}"', 'value="web"', 'hidden_inputs', "Not a {{...}} placeholder: source='web'"),
+    ('<div id="dialog-content">', '<div id="dialog-body">', 'dialog_content', 'No id="dialog-content" element'),
+])
+def test_each_check_fails_on_its_own(processed, old, new, check, message):
+    assert PageValidator('fxleader').validate(edited(processed, old, new)) == [(check, message)]
+
+
+def test_join_form_checks_only_look_inside_the_form(processed):
+    # The submit button moved out of the form no longer counts
+    html = edited(processed, '<button id="submitBtn" type="submit">', '<button type="submit">')
+    html = edited(html, '</form>', '</form><button id="submitBtn" type="submit">x</button>')
+    assert PageValidator('fxleader').validate(html) == [
+        ('submit_button', 'No submit button id="submitBtn" inside joinForm')]
+    html = edited(processed, 'id="joinForm"', 'id="otherForm"')
+    assert [check for check, _ in PageValidator('fxleader').validate(html)] == ['join_form']
+
+
+def test_without_link_id_any_value_passes(processed):
+    html = edited(processed, 'value="fxleader" name="link_id"', 'value="other" name="link_id"')
+    assert PageValidator().validate(html) == []
+
+
+def test_report_logs_one_line_per_failure(processed):
+    log = StepLog()
+    assert PageValidator('fxleader').report(processed, log)
+    assert log.results[-1].messages == ['All 9 fxleader.md checks passed']
+    log = StepLog()
+    assert not PageValidator('fxleader').report(edited(processed, 'id="dialog-content"', 'id="x"'), log)
+    result = log.results[-1]
+    assert (result.step, result.status) == ('validate', 'failed')
+    assert result.messages == ['dialog_content: No id="dialog-content" element']
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fxleader.md validator for already modified pages
+
+`python3 validate.py` checks every language page of the campaigns in
+config.json; `python3 validate.py PATH ...` checks the given pages, and
+every index.html below the given directories. Each page gets one
+PageValidator pass (see modify_html.py): the gtag script once, the
+Turnstile dependencies, no absolute URL left on the configured hosts,
+<form id="joinForm"> with the countryChange() country select, the
+cf-turnstile div, the submitBtn button and the seven hidden inputs inside
+it, and the dialog-content element.
+
+Pages are checked on a process pool and reported one record per page
+through the run log (text or JSON lines, see runlog.py). The exit status
+is 1 if any page fails a check, so the script can gate CI.
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+
+from modify_html import PageValidator, resolve_campaign
+from runlog import LEVELS, RunLog, StepLog
+
+# Pages per task handed to a worker: enough to amortize the round trip
+CHUNK_PAGES = 16
+
+
+def validate_file(path: str, validator: PageValidator, label: Optional[str] = None) -> StepLog:
+    """Check one page file; the outcome is a page log with a 'validate' step"""
+    page = StepLog(page=label or path, path=path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        page.failed(f"Could not read {path}: {e}")
+        return page.finish()
+    validator.report(html, page)
+    return page.finish()
+
+
+def _validate_task(task: tuple) -> StepLog:
+    return validate_file(*task)
+
+
+def validate_files(tasks: list, jobs: int = 1) -> list:
+    """Run validate_file over (path, validator, label) tuples; page logs in task order"""
+    if jobs <= 1 or len(tasks) <= 1:
+        return [validate_file(*task) for task in tasks]
+    chunk = max(1, min(CHUNK_PAGES, len(tasks) // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+        return list(pool.map(_validate_task, tasks, chunksize=chunk))
+
+
+def page_paths(paths: list) -> list:
+    """The given files, plus every index.html below the given directories, in sorted order"""
+    pages = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != 'node_modules')
+                if 'index.html' in files:
+                    pages.append(os.path.join(root, 'index.html'))
+        else:
+            pages.append(path)
+    return pages
+
+
+def config_tasks(config_path: str, log: RunLog) -> list:
+    """(path, validator, label) for every language page of the campaigns in config.json"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    script_dir = os.path.dirname(os.path.abspath(config_path))
+    shared = {key: value for key, value in config.items() if key != 'campaigns'}
+    tasks = []
+    for entry in config.get('campaigns') or [{}]:
+        campaign = resolve_campaign(dict(shared, **entry), script_dir, log)
+        if campaign is None:
+            continue
+        validator = PageValidator.for_campaign(campaign['working_dir'], campaign['name'],
+                                               campaign['modifier_options'])
+        for lang in campaign['languages']:
+            tasks.append((os.path.join(campaign['example_dir'], lang, 'index.html'), validator,
+                          f"{campaign['name']}/{lang}"))
+    return tasks
+
+
+def main(argv: Optional[list] = None) -> int:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Check modified pages against the fxleader.md requirements')
+    parser.add_argument('paths', nargs='*', metavar='PATH',
+                        help="pages, or directories to search for index.html (default: the campaigns of --config)")
+    parser.add_argument('--config', default=os.path.join(script_dir, 'config.json'),
+                        help="config.json whose campaign pages and settings to use")
+    parser.add_argument('--link-id', help="with PATHs, the expected link_id value (default: not checked)")
+    parser.add_argument('--url-host', action='append', dest='url_hosts', metavar='HOST',
+                        help="with PATHs, a host whose absolute URLs must be gone (repeatable, default: www.fisg.com)")
+    parser.add_argument('--jobs', type=int, default=0, metavar='N',
+                        help="worker processes (default 0 = one per CPU)")
+    parser.add_argument('--log-level', choices=LEVELS, default='info',
+                        help="'warning' shows only the failed pages (default: info)")
+    parser.add_argument('-q', '--quiet', action='store_const', dest='log_level', const='warning',
+                        help="same as --log-level warning")
+    parser.add_argument('--log-format', choices=('text', 'json'), default='text',
+                        help="'json' writes one JSON line per page and a summary line")
+    args = parser.parse_args(argv)
+
+    log = RunLog(args.log_level, args.log_format, sys.stdout)
+    if args.paths:
+        validator = PageValidator(args.link_id, args.url_hosts)
+        tasks = [(path, validator, path) for path in page_paths(args.paths)]
+    else:
+        try:
+            tasks = config_tasks(args.config, log)
+        except (OSError, ValueError) as e:
+            log.message('failed', f"Could not load {args.config}: {e}")
+            return 1
+    if not tasks:
+        log.message('failed', "No pages to validate")
+        return 1
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    pages = validate_files(tasks, jobs)
+    for page in pages:
+        log.write_page(page)
+    failed = sum(1 for page in pages if page.status == 'failed')
+    log.summary({page.labels['page']: page.status != 'failed' for page in pages})
+    log.message('failed' if failed else 'ok', f"{len(pages) - failed}/{len(pages)} pages passed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+File watching for `modify_html.py --watch`
+
+`Watcher.create(paths)` returns an inotify watcher on Linux and a polling
+watcher elsewhere (or when inotify cannot be set up). Both answer
+`changes(debounce)`: block until at least one watched file changes, keep
+collecting until the files have been quiet for `debounce` seconds, and
+return the set of changed paths.
+
+Only the given files are reported. Temporary files written next to them
+(editors' swap files, write_atomic's temp files) are ignored, and
+`settle(path)` marks a file's current state as already handled, so the
+watcher does not report a file the caller has just written itself.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from runlog import RunLog
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+MAX_BATCH_SECONDS = 5.0
+
+
+def file_state(path: str) -> Optional[tuple]:
+    """(mtime_ns, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Watcher(ABC):
+    """Reports which of a fixed set of files changed (see the module docstring)"""
+
+    def __init__(self, paths: list):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.settled = {path: file_state(path) for path in self.paths}
+
+    @staticmethod
+    def create(paths: list, poll: bool = False, interval: float = 0.5, log: Optional[RunLog] = None) -> 'Watcher':
+        if not poll and sys.platform.startswith('linux'):
+            try:
+                return InotifyWatcher(paths)
+            except OSError as e:
+                (log or RunLog()).message('warning', f"inotify unavailable ({e}), polling every {interval}s")
+        return PollingWatcher(paths, interval)
+
+    def settle(self, path: str) -> None:
+        """Record the file's current state as handled"""
+        path = os.path.abspath(path)
+        self.settled[path] = file_state(path)
+
+    @abstractmethod
+    def _candidates(self, timeout: Optional[float]) -> set:
+        """Paths that may have changed, waiting up to timeout seconds (None = forever)"""
+
+    def changes(self, debounce: float = 0.3) -> set:
+        """Block until a watched file changes, then return every file that changed in the burst"""
+        pending = set()
+        while not pending:
+            pending = self._candidates(None)
+        started = time.monotonic()
+        while time.monotonic() - started < MAX_BATCH_SECONDS:
+            more = self._candidates(debounce)
+            if not more:
+                break
+            pending |= more
+        changed = set()
+        for path in pending:
+            state = file_state(path)
+            if state is not None and state != self.settled.get(path):
+                self.settled[path] = state
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    """Compares every file's (mtime, size) every `interval` seconds"""
+
+    kind = 'polling'
+
+    def __init__(self, paths: list, interval: float = 0.5):
+        super().__init__(paths)
+        self.interval = interval
+        self.seen = dict(self.settled)
+
+    def _candidates(self, timeout: Optional[float]) -> set:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path in self.paths:
+                state = file_state(path)
+                if state != self.seen.get(path):
+                    self.seen[path] = state
+                    changed.add(path)
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            wait = self.interval if deadline is None else min(self.interval, max(deadline - time.monotonic(), 0))
+            time.sleep(wait)
+
+
+class InotifyWatcher(Watcher):
+    """Linux inotify on the directories of the watched files, through libc"""
+
+    kind = 'inotify'
+
+    def __init__(self, paths: list):
+        super().__init__(paths)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'no inotify in libc')
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        # watch descriptor -> {file name: path} of the watched files in that directory
+        self.names = {}
+        directories = {}
+        for path in self.paths:
+            directories.setdefault(os.path.dirname(path), {})[os.path.basename(path)] = path
+        try:
+            for directory, names in directories.items():
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"{os.strerror(ctypes.get_errno())}: {directory}")
+                self.names[wd] = names
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _candidates(self, timeout: Optional[float]) -> set:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: check every file
+                    changed.update(self.paths)
+                elif name in self.names.get(wd, ()):
+                    changed.add(self.names[wd][name])
+        return changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1